@@ -7,79 +7,212 @@ Created on Wed Aug 15 15:25:23 2018
 
 import numpy as np
 from scipy.fftpack import dct, idct
-import pylab as plt
 import math
+from spectrum_cache import spectrum_cache
+from dataset import Dataset
+#pylab is slow to import, so it is only imported inside the plotting methods
 
 
 class Drift(object):
-    def __init__(self, timestamps_array, data_array, nCounts=None):
-        '''Input an array of of the num of 1 counts per timestamp'''
+    def __init__(self, timestamps_array, data_array=None, nCounts=None):
+        '''
+        Input an array of of the num of 1 counts per timestamp.
+        nCounts is either the number of counts in every sample, or an array with the number of counts
+        for each timestamp (e.g. for partially merged data, where rows carry different numbers of bits).
+        A Dataset can be passed in place of all three.
+        '''
+        if isinstance(timestamps_array, Dataset):
+            timestamps_array, data_array, nCounts = timestamps_array.times, timestamps_array.ones, timestamps_array.counts
         self.data = data_array
         self.times = timestamps_array
         self.samples = len(data_array)
+        if nCounts is not None and np.ndim(nCounts) > 0:
+            nCounts = np.asarray(nCounts)
+            if len(nCounts) != self.samples:
+                raise ValueError("Must have the same number of counts as data points!")
         self.counts = nCounts
         
-        summed_timestep = 0
-        for i in range(1, self.samples):
-            summed_timestep += self.times[i] - self.times[i-1]
-        self.avg_timestep = summed_timestep/self.samples
-        
         #check if input is valid
-        for point in self.data:
-            if nCounts != None:
-                if point > self.counts:
-                    raise ValueError("Cannot have a sample with greater than nCounts!")
-                elif point < 0:
-                    raise ValueError("Cannot have a sample with negative counts!")
+        if nCounts is not None:
+            data = np.asarray(self.data)
+            if np.any(data > self.counts):
+                raise ValueError("Cannot have a sample with greater than nCounts!")
+            elif np.any(data < 0):
+                raise ValueError("Cannot have a sample with negative counts!")
                     
         if len(self.data) != len(self.times):
             raise ValueError("Must have the same number of data points and timestamps!")
         
         #initialize variables
-        self.timesteps = [0]*(len(self.times)-1) #will list the time spacing between all 
-        for i in range(0, len(self.times)-1 ):
-            self.timesteps[i] = self.times[i+1] - self.times[i]
+        self.timesteps = np.diff(np.asarray(self.times, dtype=float)) #will list the time spacing between all
         self.avg_timestep = np.mean(self.timesteps)
         self.frequencies = np.zeros(self.samples)
         self.modes = np.zeros(self.samples)
         self.powers = np.zeros(self.samples)
+        self.null_hypothesis = None
         
     def __repr__(self):
-        return "Drift(Len={}, start_time={}s, end_time={}s, counts_per_sample={}, average_timestep={:.3}s".format(self.samples, self.times[0], self.times[-1], self.counts, self.avg_timestep)
+        if np.ndim(self.counts) > 0:
+            counts = "{}-{}".format(np.min(self.counts), np.max(self.counts))
+        else:
+            counts = self.counts
+        return "Drift(Len={}, start_time={}s, end_time={}s, counts_per_sample={}, average_timestep={:.3}s".format(self.samples, self.times[0], self.times[-1], counts, self.avg_timestep)
     
-    def _dct(self, print_details=False, null_hypothesis=None):
+    def _dct(self, print_details=False, null_hypothesis=None, use_cache=True):
         """    
         x : array; Data string, on which the normalization and discrete cosine transformation is performed. If
             counts is not specified, this must be a bit string.
         null_hypothesis : array, optional
             If not None, an array to use in the normalization before the DCT. If None, it is
             taken to be an array in which every element is the mean of x.
+        use_cache : bool, optional
+            If True, the modes are looked up in (and saved to) spectrum_cache, keyed by the data,
+            timestamps, counts and null hypothesis. The cache holds at most spectrum_cache.max_bytes
+            of spectra in memory, so very long records are only cached on disk (if cache_dir is set).
         """
         delta_freq = 1/(2*self.avg_timestep*self.samples)
         self.frequencies = np.arange(0, self.samples*delta_freq, delta_freq)
         if print_details:
             print("Frequency spacing is {:.4f} Hz".format(delta_freq))
-        x = self.data
-        nCounts = self.counts
-        x_mean = np.mean(x)
-        N = len(x) 
-        # If the null hypothesis is not specified, we take our null hypothesis to be a constant bias
-        # coin, with the bias given by the mean of the data / number of counts.
-        if null_hypothesis is None:    
-            null_hypothesis = x_mean/nCounts
-            if null_hypothesis <= 0 or null_hypothesis >= 1:
-                return np.zeros(N)
-        input_array= (x - nCounts*null_hypothesis)/np.sqrt(nCounts*null_hypothesis * (1 - null_hypothesis))
+        key = self._cache_key('dct', None, null_hypothesis) if use_cache else None
+        cached = spectrum_cache.get(key) if use_cache else None
+        if cached is not None:
+            self.null_hypothesis = cached['null_hypothesis'][()]
+            self.modes = np.array(cached['modes'])
+            self.powers = self.modes**2
+            return
+        input_array = self._normalized_input(null_hypothesis)
+        if input_array is None:
+            return np.zeros(self.samples)
+        self.null_hypothesis = self._null_hypothesis(null_hypothesis)
         self.modes = dct(input_array, norm='ortho')
         self.powers = self.modes**2
-    
+        if use_cache:
+            spectrum_cache.put(key, {'modes': self.modes, 'null_hypothesis': self.null_hypothesis})
+
+    def _cache_key(self, mode, window, null_hypothesis):
+        '''
+        Key for spectrum_cache: a fingerprint of the data, timestamps and counts, plus the null hypothesis,
+        the spectrum mode ('dct' or 'zoom') and the frequency window it was evaluated over.
+        '''
+        return spectrum_cache.key(mode, window, self.data, self.times, self.counts, null_hypothesis)
+
+    def _null_hypothesis(self, null_hypothesis=None):
+        '''
+        Returns the null hypothesis probability to normalize with. Returns None if it isn't specified
+        and the data is a coin that always (or never) gives 1.
+        '''
+        # If the null hypothesis is not specified, we take our null hypothesis to be a constant bias
+        # coin, with the bias given by the total 1 counts / total number of counts. With the same
+        # number of counts in every sample this is just the mean of the data / number of counts.
+        if null_hypothesis is None:
+            null_hypothesis = np.mean(self.data)/np.mean(self.counts)
+            if null_hypothesis <= 0 or null_hypothesis >= 1:
+                return None
+        return null_hypothesis
+
+    def _normalized_input(self, null_hypothesis=None):
+        '''
+        Returns the data normalized by the binomial variance of the null hypothesis, i.e. the array
+        that goes into the DCT. Returns None if the null hypothesis is a coin that always (or never) gives 1.
+        Each sample is normalized with its own number of counts, (x_i - n_i*p)/sqrt(n_i*p*(1-p)), so rows
+        with different numbers of bits all have unit variance under the null hypothesis.
+        '''
+        x = self.data
+        nCounts = self.counts
+        null_hypothesis = self._null_hypothesis(null_hypothesis)
+        if null_hypothesis is None:
+            return None
+        return (x - nCounts*null_hypothesis)/np.sqrt(nCounts*null_hypothesis * (1 - null_hypothesis))
+
+    def _zoom(self, low_freq, high_freq, num_freqs=1000, print_details=False, null_hypothesis=None, use_cache=True):
+        '''
+        Evaluates the spectrum on num_freqs evenly spaced frequencies from low_freq to high_freq (in Hz)
+        with the chirp-z transform, so the grid can be much finer than the 1/(2T) spacing of _dct,
+        at O((N+M)log(N+M)) cost.
+
+        Sets self.zoom_frequencies, self.zoom_modes and self.zoom_powers. The modes are complex; on the
+        _dct frequency grid their real part is the DCT mode. The powers are |mode|^2, which don't depend
+        on the phase of the signal, so a peak between two DCT bins shows up as a single smooth line.
+        '''
+        if num_freqs < 2:
+            raise ValueError("Need at least 2 frequencies to zoom into a band!")
+        if high_freq <= low_freq:
+            raise ValueError("The upper frequency of the band must be greater than the lower frequency!")
+        delta_freq = (high_freq - low_freq)/(num_freqs - 1)
+        self.zoom_frequencies = low_freq + delta_freq*np.arange(num_freqs)
+        if print_details:
+            print("Zoomed frequency spacing is {:.3e} Hz ({:.1f}x finer than the DCT)".format(delta_freq,
+                  1/(2*self.avg_timestep*self.samples*delta_freq)))
+        key = self._cache_key('zoom', (low_freq, high_freq, num_freqs), null_hypothesis) if use_cache else None
+        cached = spectrum_cache.get(key) if use_cache else None
+        if cached is not None:
+            self.zoom_modes = np.array(cached['zoom_modes'])
+        else:
+            input_array = self._normalized_input(null_hypothesis)
+            if input_array is None:
+                input_array = np.zeros(self.samples)
+            dt = self.avg_timestep
+            #the DCT-II mode at frequency f is sqrt(2/N)*Re[sum_n x_n exp(-2j*pi*f*dt*(n + 1/2))]
+            summed = chirp_z(input_array, num_freqs, 2*np.pi*low_freq*dt, 2*np.pi*delta_freq*dt)
+            self.zoom_modes = np.sqrt(2/self.samples)*np.exp(-1j*np.pi*self.zoom_frequencies*dt)*summed
+            if use_cache:
+                spectrum_cache.put(key, {'zoom_modes': self.zoom_modes})
+        self.zoom_powers = np.abs(self.zoom_modes)**2
+        return self.zoom_frequencies, self.zoom_powers
+
+    def find_peak(self, low_freq, high_freq, num_freqs=1000, print_details=False, null_hypothesis=None):
+        '''
+        Zooms into the band from low_freq to high_freq and returns the (frequency, power) of the highest
+        peak in it, refined to a fraction of the zoomed frequency spacing by parabolic interpolation.
+        '''
+        frequencies, powers = self._zoom(low_freq, high_freq, num_freqs, print_details, null_hypothesis)
+        peak_freq, peak_power = interpolate_peak(frequencies, powers)
+        if print_details:
+            print("Peak power of {:.3f} at {:.5f} Hz".format(peak_power, peak_freq))
+        return peak_freq, peak_power
+
+    def band_masks(self, bands, rule='all'):
+        '''
+        Returns a (len(bands) x N) boolean array selecting modes of the last _dct, one row per
+        (low_freq, high_freq) band. Frequencies strictly between the band edges are used.
+        rule='all' keeps every mode in the band; rule='max' keeps only the mode with the highest power.
+        '''
+        bands = np.asarray(bands, dtype=float).reshape(-1, 2)
+        frequencies = np.asarray(self.frequencies)
+        masks = (frequencies > bands[:, :1]) & (frequencies < bands[:, 1:])
+        if rule == 'max':
+            in_band_powers = np.where(masks, self.powers, -np.inf)
+            max_index = np.argmax(in_band_powers, axis=1)
+            has_modes = masks.any(axis=1)
+            masks = np.zeros_like(masks)
+            masks[has_modes, max_index[has_modes]] = True
+        elif rule != 'all':
+            raise ValueError("Mode selection rule must be either 'all' or 'max'!")
+        return masks
+
+    def reconstruct(self, masks, renormalize='logistic', rule='all'):
+        '''
+        Reconstructs the 1-state probability from a subset of the modes of the last _dct.
+        masks: a (B x N) array (or a single length-N array) of booleans or weights applied to self.modes,
+            or a list of (low_freq, high_freq) bands that are turned into masks with band_masks(bands, rule).
+        renormalize: 'logistic', 'clip' or None; how to squash the reconstruction back into [0, 1].
+        Returns a (B x N) array, one probability trace per mask, from a single batched IDCT.
+        '''
+        if self.null_hypothesis is None:
+            raise ValueError("Must do a _dct (with a valid null hypothesis) before reconstructing!")
+        masks = np.asarray(masks)
+        if masks.ndim == 2 and masks.shape[1] == 2 and self.samples != 2:
+            masks = self.band_masks(masks, rule)
+        masks = np.atleast_2d(masks)
+        if masks.shape[1] != self.samples:
+            raise ValueError("Each mask must have one entry per mode!")
+        return idct_reconstruction(masks*self.modes, self.null_hypothesis, self.counts, renormalize)
+
     def _manual_ndft(self, print_details=False):
         times = self.times
-        vals = self.data
-        nCounts = self.counts
         N = self.samples
-        null_hypothesis = np.mean(vals)/nCounts
-        input_array= (vals - nCounts*null_hypothesis)/np.sqrt(nCounts*null_hypothesis * (1 - null_hypothesis))
+        input_array = self._normalized_input()
         T = times[-1]
         if print_details: print("Will return {}-frequencies (N/2), spaced at {} Hz".format(math.ceil(N/2), (1/T)))
         frequencies = np.arange(N)*(1/T)
@@ -112,6 +245,7 @@ class Drift(object):
         return self.frequencies, self.powers
     
     def plot_input(self):
+        import pylab as plt
         plt.plot(self.times, self.data,marker='.')
         plt.grid()
         plt.xlabel("Time, s")
@@ -121,12 +255,82 @@ class Drift(object):
     
         
     def plot_power_spectrum(self):
+        import pylab as plt
         plt.plot(self.frequencies, self.powers, marker='.')
         plt.grid()
         plt.xlabel("Frequency, Hz")
         plt.ylabel("Power, a.u.")
         plt.title("Power Spectrum")
         plt.show()
-    
-    
-    
\ No newline at end of file
+
+
+def chirp_z(x, num_points, start_angle, step_angle):
+    '''
+    Returns sum_n x[n]*exp(-1j*n*(start_angle + m*step_angle)) for m = 0, 1, ..., num_points-1.
+    Uses Bluestein's algorithm: nm = (n^2 + m^2 - (m-n)^2)/2 turns the sum into a convolution,
+    which is done with FFTs of a power-of-2 length >= len(x) + num_points - 1.
+    '''
+    x = np.asarray(x, dtype=complex)
+    N = len(x)
+    M = num_points
+    L = 1 << int(np.ceil(np.log2(N + M - 1)))
+    n = np.arange(N, dtype=float)
+    m = np.arange(M, dtype=float)
+    weighted = np.zeros(L, dtype=complex)
+    weighted[:N] = x*np.exp(-1j*(start_angle*n + step_angle*n**2/2))
+    chirp = np.zeros(L, dtype=complex)
+    chirp[:M] = np.exp(1j*step_angle*m**2/2)
+    #negative lags (m - n < 0) wrap around to the end of the convolution kernel
+    chirp[L-N+1:] = np.exp(1j*step_angle*n[N-1:0:-1]**2/2)
+    convolved = np.fft.ifft(np.fft.fft(weighted)*np.fft.fft(chirp))[:M]
+    return convolved*np.exp(-1j*step_angle*m**2/2)
+
+def renormalize_probabilities(probabilities, method='logistic'):
+    '''
+    Squashes reconstructed probabilities back into [0, 1], row by row for a 2-D array.
+    'logistic' maps each row through mean + nu*tanh((p - mean)/nu), with nu = min(mean, 1 - mean),
+    like pyGSTi's drift.renormalizer; 'clip' just clips to [0, 1]; None leaves them unchanged.
+    '''
+    probabilities = np.asarray(probabilities, dtype=float)
+    if method is None:
+        return probabilities
+    if method == 'clip':
+        return np.clip(probabilities, 0, 1)
+    if method != 'logistic':
+        raise ValueError("Renormalization method must be 'logistic', 'clip' or None!")
+    mean = np.mean(probabilities, axis=-1, keepdims=True)
+    nu = np.minimum(mean, 1 - mean)
+    return mean + nu*np.tanh((probabilities - mean)/nu)
+
+def idct_reconstruction(modes, null_hypothesis, nCounts, renormalize='logistic'):
+    '''
+    Inverse of the Drift._dct normalization for a batch of mode arrays (one per row).
+    Does one IDCT along the last axis, scales by the binomial standard deviation of the null hypothesis
+    and adds it back, then renormalizes. nCounts may be a scalar or an array with the counts per sample.
+    Returns the 1-state probabilities with the same shape as modes.
+    '''
+    modes = np.asarray(modes, dtype=float)
+    null_hypothesis = np.asarray(null_hypothesis, dtype=float)
+    nCounts = np.asarray(nCounts, dtype=float)
+    probabilities = null_hypothesis + idct(modes, norm='ortho', axis=-1)*np.sqrt(null_hypothesis*(1 - null_hypothesis)/nCounts)
+    return renormalize_probabilities(probabilities, renormalize)
+
+def interpolate_peak(frequencies, powers):
+    '''
+    Finds the highest power and fits a parabola through it and its two neighbours.
+    Returns the (frequency, power) at the vertex of the parabola, which locates the peak to a
+    fraction of the frequency spacing. Assumes evenly spaced frequencies.
+    '''
+    frequencies = np.asarray(frequencies)
+    powers = np.asarray(powers)
+    index = int(np.argmax(powers))
+    if index == 0 or index == len(powers) - 1:
+        #the peak is at the edge of the band, so there's nothing to interpolate against
+        return frequencies[index], powers[index]
+    below, center, above = powers[index - 1], powers[index], powers[index + 1]
+    curvature = below - 2*center + above
+    if curvature == 0:
+        return frequencies[index], center
+    offset = 0.5*(below - above)/curvature
+    delta_freq = frequencies[index + 1] - frequencies[index]
+    return frequencies[index] + offset*delta_freq, center - 0.25*(below - above)*offset
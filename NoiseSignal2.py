@@ -1,6 +1,6 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import bisect
+import heapq
+from collections import OrderedDict
 
 # Base class for all noisy signals
 # Not to be used directly. Use the derived classes instead
@@ -43,17 +43,60 @@ class NoiseSignal(object):
         self.do_interpolation = do_interpolation
         # resolution of samples from the signal
         self.interpolation_resolution = resolution_factor
-        # window to interpolate over
+        # window to interpolate over (no longer needed, as the interpolation uses all the stored points)
         self.interpolation_time = itime
 
+    def _time_indices(self, t):
+        '''Index of the stored point for each time in t (a scalar or an array), after checking that they are in range'''
+        t = np.asarray(t, dtype=float)
+        if np.any(t>self.total_time):
+            raise ValueError("{}(): Requested time greater than total simulation time (max requested {})".format(type(self).__name__, np.max(t)))
+        if np.any(t<0):
+            raise ValueError("{}(): Requested time < 0".format(type(self).__name__))
+        return (t*self.resolution_factor).astype(int)
+
+    def _interpolation_scale(self):
+        # the stored sample data times this gives the values that eval returns
+        return self.amplitude
+
     def eval_interpolated(self, t):
+        '''Linear interpolation between the stored points at t, which may be a single time or an array of times'''
         if self.do_interpolation:
             time_steps, data_samples = self.get_sample_data(t)
-            ival = np.interp(t, time_steps, data_samples)*self.amplitude
+            if len(time_steps)<2:
+                raise ValueError("Cannot find enough sample data")
+            ival = np.interp(t, time_steps, data_samples)*self._interpolation_scale()
             return ival
         else:
             return self.eval(t)
         
+class GrowableArray(object):
+    '''
+    A float64 array that grows as values are appended, with amortized O(1) appends,
+    for the signals whose points get extended by every next_interval call.
+    view() returns the values so far without copying.
+    '''
+    def __init__(self, capacity=0):
+        self._data = np.empty(capacity)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=float)
+        needed = self.size + len(values)
+        if needed > len(self._data):
+            #grow geometrically, but the first extend allocates exactly what it needs
+            grown = np.empty(max(needed, 2*len(self._data)) if self.size > 0 else needed)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:needed] = values
+        self.size = needed
+
+    def view(self):
+        return self._data[:self.size]
+
 class NoiseSignalRandomWalk(NoiseSignal):
     '''
     Creates a random walk function, starting at 0, over a specified time interval.
@@ -71,11 +114,23 @@ class NoiseSignalRandomWalk(NoiseSignal):
         self.amplitude = amplitude
         self.resolution_factor = resolution_factor
         self.total_time = total_time #number of time_units per .init() call
-        self.points = []
-        self.times = []
+        self._points = GrowableArray()
+        self._times = GrowableArray()
         self.num_points = int(self.total_time*self.resolution_factor)
         self.next_interval_start_time = 0
-        
+
+    @property
+    def points(self):
+        return self._points.view()
+
+    @property
+    def times(self):
+        return self._times.view()
+
+    def _steps(self, rand_switch, num_steps):
+        #one randint(2) per step, drawn all at once (the same values as drawing them one at a time)
+        return np.where(rand_switch.randint(2, size=num_steps) == 1, self.amplitude, -1*self.amplitude)
+
     def init(self, random_seed=None):
         '''
         Starts a random walk from zero, up to total_time with num_points in between.
@@ -84,37 +139,31 @@ class NoiseSignalRandomWalk(NoiseSignal):
             random_seed = self.get_new_seed()
         rand_switch = np.random.RandomState(random_seed)
         num_points = self.num_points
-        binaries = [0] + [self.amplitude if rand_switch.randint(2)==1 else -1*self.amplitude for i in range(num_points-1)]
-        points = [0]*num_points
-        points[0] = 0
-        for i in range(1, num_points):
-            points[i] = points[i-1] + binaries[i]
-        self.points += points
+        binaries = np.concatenate(([0.], self._steps(rand_switch, max(num_points-1, 0))))
+        self._points.extend(np.cumsum(binaries)[:num_points])
         step = (self.total_time - 0)/self.num_points
-        if len(self.times) == 0:
-            self.times += [i*step for i in range(num_points)]  #array of times from 0 to total_time, units of time_unit
+        if len(self._times) == 0:
+            self._times.extend(np.arange(num_points)*step)  #array of times from 0 to total_time, units of time_unit
             self.next_interval_start_time = num_points*step
         else:
-            self.times += [self.next_interval_start_time+i*step for i in range(num_points)]
+            self._times.extend(self.next_interval_start_time + np.arange(num_points)*step)
             self.next_interval_start_time = self.next_interval_start_time + num_points*step
         self.is_init = True
         return random_seed
     
     def eval(self, t):
-        '''Returns noise value at time t (specified in time_unit) in units of time_unit'''
-        if t>self.total_time:
-            raise ValueError("NoiseSignalNormal(): Requested time greater than total simulation time")
-        if t<0:
-            raise ValueError("NoiseSignalNormal(): Requested time < 0")
-
-        tidx = int(t*self.resolution_factor)
-        return self.points[tidx]
+        '''Returns noise value at time t (specified in time_unit) in units of time_unit; t may be an array of times'''
+        return self.points[self._time_indices(t)]
     
-    def get_sample_data(self):
+    def get_sample_data(self, t=None):
         '''returns a tuple with a time list and associated noise values at each time point'''
         times = self.times #returns all the calculated times, including any .next_intervals() you may do
         vals = self.points
         return times, vals
+
+    def _interpolation_scale(self):
+        # the points already include the step amplitude
+        return 1.0
     
     def next_interval(self,random_seed=None):
         '''Does self.init again, but starts where the last init ended, not from zero.
@@ -124,18 +173,16 @@ class NoiseSignalRandomWalk(NoiseSignal):
             random_seed = self.get_new_seed()
         rand_switch = np.random.RandomState(random_seed)
         num_points = int(self.total_time * self.resolution_factor)
-        binaries = [self.amplitude if rand_switch.randint(2)==1 else -1*self.amplitude for i in range(num_points)]
-        points = [0]*num_points
-        points[0] = binaries[0] + self.points[len(self.points) -1]
-        for i in range(1, num_points):
-            points[i] = points[i-1] + binaries[i]
-        self.points += points
+        #continue the walk from its last value
+        binaries = np.concatenate(([self.points[-1]], self._steps(rand_switch, num_points)))
+        self._points.extend(np.cumsum(binaries)[1:])
         step = (self.total_time - 0)/self.num_points
-        self.times += [self.next_interval_start_time+i*step for i in range(num_points)]
+        self._times.extend(self.next_interval_start_time + np.arange(num_points)*step)
         self.next_interval_start_time = self.next_interval_start_time + num_points*step
         return random_seed
     
     def plot_noise_signal(self):
+        import matplotlib.pyplot as plt
         if self.is_init == False:
             raise ValueError("Must be initialized first!")
         marker = '.'
@@ -158,92 +205,104 @@ class NoiseSignalSine(NoiseSignal):
     def __str__(self):
         return "NoiseSignalSine(resolution_factor={0}, seed={1}".format(self.resolution_factor, self.random_seed)
 
-    def configure_noise(self, resolution_factor, freq_list, amp_list, phase_list, total_time):
+    def configure_noise(self, resolution_factor, freq_list, amp_list, phase_list, total_time, store_components=True):
         '''
         resolution factor: how many points per time_unit
         freq_list: a list or tuple of the all the desired frequencies, in Hz
         amp_list: a list or tuple of the amplitudes for all frequencies
         phase_list: a list or tuple of the phases of all the waves (all lists should be the same length)
         total_time: total # of time_units you want to cover per .init call
+        store_components: False to keep only the summed wave, not each frequency's wave (saves n_freqs arrays of memory)
         '''
         self.resolution_factor = resolution_factor
         self.total_time = total_time #number of time_units per .init() call
-        self.list_of_point_lists = []
-        self.summed_points = []
-        self.times = []
+        self.store_components = store_components
+        self._components = None #one GrowableArray per frequency with its wave, if store_components
+        self._summed_points = GrowableArray()
+        self._times = GrowableArray()
         self.num_points = int(self.total_time*self.resolution_factor)
         self.step = self.total_time/self.num_points #the time interval between time points, in units of time_units
         self.next_interval_start_time = 0
         self.freq_list = freq_list
         self.amp_list = amp_list
         self.phase_list = phase_list
-        
-    def init(self):
-        times = [i*self.step for i in range(0,self.num_points+1)] #step = totaltime/numpoints, numpoits = int(totaltime*resfactor)
-        #print(times)
-        list_of_point_lists = [0]*len(self.freq_list)
-        for i in range(len(self.freq_list)):
-            '''find values for each frequency, then sum them up later'''
-            freq = self.freq_list[i]
-            amp = self.amp_list[i]
-            phase = self.phase_list[i]
-            value_list = []
-            for t in times:
-                val = amp*np.sin(2*np.pi*freq*t*self.time_unit + phase)
-                value_list.append(val)
-            list_of_point_lists[i] = value_list
-        self.list_of_point_lists = list_of_point_lists
-        #each frequency's list is done, now add them all together in one list
-        summed_vals = [0]*len(times)
-        for t_index in range(len(times)):
-            for wave_index in range(len(self.list_of_point_lists)):
-                summed_vals[t_index] += self.list_of_point_lists[wave_index][t_index]
-        #print(summed_vals)
-        self.summed_points += summed_vals
-        #add these lines at the end of the init call
-        self.times += times
+
+    @property
+    def summed_points(self):
+        return self._summed_points.view()
+
+    @property
+    def times(self):
+        return self._times.view()
+
+    @property
+    def components(self):
+        #(n_freqs x n_points) array of each frequency's wave, or None if they aren't stored
+        if self._components is None:
+            return None
+        return np.array([row.view() for row in self._components])
+
+    @property
+    def list_of_point_lists(self):
+        components = self.components
+        return components if components is not None else np.zeros((len(self.freq_list), 0))
+
+    def _waves(self, times, wave_indices=slice(None)):
+        #the waves of the selected frequencies at times, one row per frequency, from one broadcasted np.sin
+        freqs = np.asarray(self.freq_list, dtype=float)[wave_indices, None]
+        amps = np.asarray(self.amp_list, dtype=float)[wave_indices, None]
+        phases = np.asarray(self.phase_list, dtype=float)[wave_indices, None]
+        return amps*np.sin(2*np.pi*freqs*times*self.time_unit + phases)
+
+    def _add_points(self, times, new_components):
+        if self.store_components:
+            waves = self._waves(times)
+            if new_components or self._components is None:
+                self._components = [GrowableArray() for wave in waves]
+            for row, wave in zip(self._components, waves):
+                row.extend(wave)
+            summed_vals = waves.sum(axis=0)
+        else:
+            #add up one frequency at a time, so no more than one wave is ever in memory
+            summed_vals = np.zeros(len(times))
+            for i in range(len(self.freq_list)):
+                summed_vals += self._waves(times, slice(i, i+1))[0]
+        self._summed_points.extend(summed_vals)
+        self._times.extend(times)
         self.next_interval_start_time = self.times[-1] + self.step
+
+    def init(self):
+        times = np.arange(self.num_points+1)*self.step #step = totaltime/numpoints, numpoits = int(totaltime*resfactor)
+        #each init starts a new set of component waves, but the summed points and times are appended to
+        self._add_points(times, new_components=True)
                 
-    def get_sample_data(self):
+    def get_sample_data(self, t=None):
         '''returns a tuple with a time list and associated noise values at each time point'''
         times = self.times #returns all the calculated times, including any .next_intervals() you may do
         vals = self.summed_points #returns the summed sine wave for each point in self.times
         return times, vals
+
+    def _interpolation_scale(self):
+        # the amplitudes are already in the summed points
+        return 1.0
     
     def add_random_noise(self, sigma):
         '''add normally distributed noise to the overall summed_values
         Specify the std deviation, sigma, of the noise, which centers on zero'''
-        for i in range(len(self.summed_points)):
-            self.summed_points[i] += np.random.normal(0,sigma)
+        summed_points = self.summed_points
+        summed_points += np.random.normal(0, sigma, size=len(summed_points))
     
     def next_interval(self):
-        times = [self.next_interval_start_time+i*self.step for i in range(self.num_points)] 
-        #print(times)
-        for i in range(len(self.freq_list)):
-            '''find values for each frequency, then su mthem up later'''
-            freq = self.freq_list[i]
-            amp = self.amp_list[i]
-            phase = self.phase_list[i]
-            value_list = []
-            for t in times:
-                val = amp*np.sin(2*np.pi*freq*t*self.time_unit + phase)
-                value_list.append(val)
-            self.list_of_point_lists[i].extend(value_list)
-
-        #each frequency's list is done, now add them all together in one list
-        summed_vals = [0]*len(times)
-        for t_index in range(len(times)):
-            for wave_index in range(len(self.list_of_point_lists)):
-                summed_vals[t_index] += self.list_of_point_lists[wave_index][t_index]
-        #print(summed_vals)
-        self.summed_points += summed_vals
-        #add these lines at the end of the init call
-        self.times += times
-        self.next_interval_start_time = self.times[-1] + self.step
+        times = self.next_interval_start_time + np.arange(self.num_points)*self.step
+        self._add_points(times, new_components=False)
         #print("After next interval, end time is {}".format(self.times[-1]))
         
     def plot_noise_signal(self, show_components=True):
-        '''Shows a plot of the individual waves, and a plot of the summed wave, if components = True'''
+        '''
+        Shows a plot of the individual waves, if show_components = True, and a plot of the summed wave.
+        The individual waves are only plotted if they were stored (store_components = True).
+        '''
+        import matplotlib.pyplot as plt
 
         times = self.times
         summed = self.summed_points
@@ -251,7 +310,7 @@ class NoiseSignalSine(NoiseSignal):
         marker ='.'
         linewidth=1
         markersize = 1
-        if show_components == True:
+        if show_components == True and self.store_components:
             for wave_index in range(len(components)):
                 wave= components[wave_index]
                 freq = self.freq_list[wave_index]
@@ -271,17 +330,8 @@ class NoiseSignalSine(NoiseSignal):
         plt.show()
     
     def eval(self, t):
-        if t>self.total_time:
-            print("Bad time is {}".format(t))
-            raise ValueError("NoiseSignalSine(): Requested time greater than total simulation time")
-        if t<0:
-            raise ValueError("NoiseSignalSine(): Requested time < 0")
-
-        tidx = int(t*self.resolution_factor)
-        #print("time t is {}".format(t))
-        #print("tindex is {}".format(tidx))
-        #print("total time is {}".format(self.total_time))
-        return self.summed_points[tidx]
+        #t may be a single time or an array of times
+        return self.summed_points[self._time_indices(t)]
         
             
     
@@ -302,6 +352,7 @@ class NoiseSignalNormal(NoiseSignal):
             return "normal_deviants = []"
 
     def plot_amplitudes(self):
+        import matplotlib.pyplot as plt
         times = [ti/self.resolution_factor for ti in range(int(self.total_time*self.resolution_factor))]
         plt.plot(times, [sv*self.amplitude for sv in self.points])
         plt.show()
@@ -320,48 +371,19 @@ class NoiseSignalNormal(NoiseSignal):
         rand_switch = np.random.RandomState(random_seed)
         num_points = int(self.total_time * self.resolution_factor)
 
-        self.points = [self.std_dev*rand_switch.randn() + self.mean for ii in range(num_points)]
+        self.points = self.std_dev*rand_switch.randn(num_points) + self.mean
+        self.times = np.arange(num_points)/self.resolution_factor
         self.is_init = True
 
         return random_seed
 
     def eval(self, t):
-        if t>self.total_time:
-            raise ValueError("NoiseSignalNormal(): Requested time greater than total simulation time")
-        if t<0:
-            raise ValueError("NoiseSignalNormal(): Requested time < 0")
-
-        tidx = int(t*self.resolution_factor)
-        return self.points[tidx]*self.amplitude
-
-    def get_sample_data(self, t):
-        lidx = int(np.floor(t*self.resolution_factor))
-        ltime = lidx/self.resolution_factor
-        uidx = int(np.ceil(t*self.resolution_factor))
-        utime = uidx/self.resolution_factor
-
-        sample_times = [ltime]
-        sample_vals = [self.points[lidx]]
-        if uidx<len(self.points):
-            sample_times += [utime]
-            sample_vals += [self.points[uidx]]
-
-        while (lidx>0 or (uidx+1)<len(self.points)) and ((len(sample_times)<2) or (utime-ltime)<self.interpolation_time):
-            if lidx>0:
-                lidx -= 1
-                ltime = lidx/self.resolution_factor
-                sample_vals = [self.points[lidx]] + sample_vals
-                sample_times = [ltime] + sample_times
-            if (uidx+1)<len(self.points):
-                uidx += 1
-                utime = uidx/self.resolution_factor
-                sample_vals += [self.points[uidx]]
-                sample_times += [utime]
-
-        if len(sample_times)<2:
-            raise ValueError("Cannot find enough sample data")
-
-        return sample_times, sample_vals
+        #t may be a single time or an array of times
+        return self.points[self._time_indices(t)]*self.amplitude
+
+    def get_sample_data(self, t=None):
+        '''returns a tuple with the times of all the points and their (unscaled) values'''
+        return self.times, self.points
 
 class NoiseSignalTelegraph(NoiseSignal):
 
@@ -379,6 +401,7 @@ class NoiseSignalTelegraph(NoiseSignal):
         return str_val
 
     def plot_amplitudes(self):
+        import matplotlib.pyplot as plt
         prev_time = -1
         switch_times = []
         switch_amps = []
@@ -398,14 +421,13 @@ class NoiseSignalTelegraph(NoiseSignal):
         plt.show()
         
     def plot_noise_signal(self):
+        import matplotlib.pyplot as plt
         if self.is_init != True:
             raise ValueError("Noise signal must first be initialized!")
         num_points = int(self.total_time/self.resolution_factor)
         step = self.total_time/num_points
-        times = [i*step for i in range(num_points)] #step = totaltime/numpoints, numpoits = int(totaltime*resfactor)
-        vals = []
-        for t in times:
-            vals.append(self[t])
+        times = np.arange(num_points)*step #step = totaltime/numpoints, numpoits = int(totaltime*resfactor)
+        vals = self[times]
         plt.plot(times, vals,marker='.',linewidth=1)
         plt.xlabel("Time in time_unit")
         plt.ylabel("Noise, arb. units")
@@ -443,111 +465,303 @@ class NoiseSignalTelegraph(NoiseSignal):
         if random_seed==None:
             random_seed = self.get_new_seed()
         self.rand_switch = np.random.RandomState(random_seed)
+        self._uniforms = np.zeros(0)
+        self._uniform_index = 0
 
         # initialize the state of each fluctuator (+-1.0)
-        self.f_state = [1.0 if self.rand_switch.randint(2)==0 else -1.0 for ii in range(self.total_fluctuators)]
+        self.f_state = [1.0 if state==0 else -1.0 for state in self.rand_switch.randint(2, size=self.total_fluctuators)]
 
         # initialize the switching time for each fluctuator
         # next switching time is exponentially distributed, so we can
         # generate a uniform rv and transform it to an exponential rv.
         # also convert from seconds to nanoseconds (1 s = 10^9 ns) and start at a random point in the interval [0,1]
-        self.f_next_switch = [(self.time_units_per_sec)*self.rand_switch.uniform()*(-np.log(1-self.rand_switch.uniform())/self.freq_points[ii]) for ii in range(self.total_fluctuators)]
-         
-        # create an array of switching times (for any fluctuator) and the sum of all the fluctuators at that time
-        #
-        self.amplitude_sums = [sum(self.f_state[ii]*self.freq_amps[ii] for ii in range(self.total_fluctuators))]
-        self.switching_times = [0.0]
+        self.f_next_switch = []
+        for ii in range(self.total_fluctuators):
+            start_fraction = self._next_uniform()
+            self.f_next_switch.append((self.time_units_per_sec)*start_fraction*(self._next_exponential()/self.freq_points[ii]))
 
-        tval = 0.0;
-        while ( tval < self.total_time ):
-            # find the fluctuator that is to switch next
-            next_switch_idx = self.f_next_switch.index(min(self.f_next_switch))
-            tval = self.f_next_switch[next_switch_idx]
+        self._generate_switches()
+        self.is_init = True
+        return random_seed
 
-            # update the switching time for this fluctuator
-            self.f_next_switch[next_switch_idx] += self.time_units_per_sec*(-np.log(1-self.rand_switch.uniform())/self.freq_points[next_switch_idx])
+    # move to a new interval of time, i.e., continue the 1/f signal without re-initializing
+    def next_interval(self):
+
+        self.f_next_switch = [next_switch-self.total_time for next_switch in self.f_next_switch]
+        self._generate_switches()
+
+    # the uniform random numbers are drawn in blocks, but used in the same order as
+    # drawing them one at a time, so a seed gives the same signal either way
+    uniform_block_size = 4096
+
+    def _refill_uniforms(self):
+        self._uniforms = self.rand_switch.uniform(size=self.uniform_block_size)
+        self._exponentials = -np.log(1-self._uniforms)
+        self._uniform_index = 0
+
+    def _next_uniform(self):
+        if self._uniform_index == len(self._uniforms):
+            self._refill_uniforms()
+        self._uniform_index += 1
+        return self._uniforms[self._uniform_index-1]
+
+    def _next_exponential(self):
+        if self._uniform_index == len(self._uniforms):
+            self._refill_uniforms()
+        self._uniform_index += 1
+        return self._exponentials[self._uniform_index-1]
+
+    def _generate_switches(self):
+        # create an array of switching times (for any fluctuator) and the sum of all the fluctuators at that time
+        # the next fluctuator to switch comes off a heap of (next switching time, fluctuator index), so ties
+        # go to the lowest index
+        start_sum = sum(self.f_state[ii]*self.freq_amps[ii] for ii in range(self.total_fluctuators))
+        heap = [(next_switch, ii) for ii, next_switch in enumerate(self.f_next_switch)]
+        heapq.heapify(heap)
+        switching_times = [0.0]
+        switch_indices = []
+        switch_states = []
+
+        tval = 0.0
+        while ( tval < self.total_time ):
+            # the fluctuator that is to switch next, and its following switching time
+            tval, next_switch_idx = heap[0]
+            heapq.heapreplace(heap, (tval + self.time_units_per_sec*(self._next_exponential()/self.freq_points[next_switch_idx]), next_switch_idx))
 
             # update the state of this fluctuator
             self.f_state[next_switch_idx] *= -1.0
 
-            # add the switching time and new sum to the lists
-            self.switching_times += [tval]
-            self.amplitude_sums += [self.amplitude_sums[len(self.amplitude_sums)-1] + self.f_state[next_switch_idx]*2.0*self.freq_amps[next_switch_idx]]
+            switching_times.append(tval)
+            switch_indices.append(next_switch_idx)
+            switch_states.append(self.f_state[next_switch_idx])
+
+        for next_switch, ii in heap:
+            self.f_next_switch[ii] = next_switch
+        self.switching_times = np.asarray(switching_times)
+        changes = np.asarray(switch_states)*2.0*np.asarray(self.freq_amps)[np.asarray(switch_indices, dtype=int)]
+        self.amplitude_sums = np.cumsum(np.concatenate(([start_sum], changes)))
+
+    # return the value of the noise at the indicated time
+    def eval(self, t):
+        #t may be a single time or an array of times
+        tdx = np.minimum(np.searchsorted(self.switching_times, t, side='left'), len(self.switching_times)-1)
+        return self.amplitude_sums[np.maximum(tdx-1, 0)]*self.amplitude
+
+
+    def get_sample_data(self, t=None):
+        '''returns a tuple with all the switching times and the (unscaled) sum of the fluctuators at each'''
+        return self.switching_times, self.amplitude_sums
 
+# Block mode: instead of generating and storing total_time worth of points up front, these signals are
+# defined by their seed and parameters and generated on demand in blocks of block_size points
+# (or block_time time_units for telegraph noise). Block k always comes from its own random stream,
+# Philox(seed) jumped k+1 times, so any block can be regenerated on its own, and only the
+# cache_blocks most recently used blocks are kept in memory.
+class BlockNoiseSignal(NoiseSignal):
+    '''
+    Base class for the block-mode signals. Not to be used directly.
+    Subclasses implement _make_block(k) and eval.
+    '''
+    def __init__(self, initial_seed=1234, time_unit=1e-9, block_size=2**16, cache_blocks=16):
+        NoiseSignal.__init__(self, initial_seed=initial_seed, time_unit=time_unit)
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self._blocks = OrderedDict()
         self.is_init = True
-        return random_seed
 
-    # move to a new interval of time, i.e., continue the 1/f signal without re-initializing
-    def next_interval(self):
+    def _generator(self, stream):
+        # stream 0 is for anything drawn once for the whole signal, stream k+1 for block k
+        return np.random.Generator(np.random.Philox(self.random_seed).jumped(stream))
+
+    def block(self, k):
+        '''Returns block k, generating it if it isn't one of the recently used blocks'''
+        if k in self._blocks:
+            self._blocks.move_to_end(k)
+            return self._blocks[k]
+        block = self._make_block(k)
+        self._blocks[k] = block
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return block
+
+    def clear_cache(self):
+        self._blocks.clear()
+
+    def _check_times(self, t):
+        t = np.asarray(t, dtype=float)
+        if np.any(t<0):
+            raise ValueError("{}(): Requested time < 0".format(type(self).__name__))
+        return t
+
+    def _group_by_block(self, block_indices):
+        # yields each block index with the positions of the times in that block, grouped with one sort
+        block_indices = block_indices.ravel()
+        order = np.argsort(block_indices, kind='stable')
+        edges = np.flatnonzero(np.diff(block_indices[order])) + 1
+        for positions in np.split(order, edges):
+            if len(positions) > 0:
+                yield int(block_indices[positions[0]]), positions
+
+    def _eval_points(self, t):
+        # for the signals made of points every 1/resolution_factor time_units
+        idx = (self._check_times(t)*self.resolution_factor).astype(np.int64)
+        block_indices = idx//self.block_size
+        if np.ndim(idx) == 0:
+            return self.block(int(block_indices))[idx % self.block_size]
+        flat_idx = idx.ravel()
+        vals = np.empty(flat_idx.shape)
+        for k, positions in self._group_by_block(block_indices):
+            vals[positions] = self.block(k)[flat_idx[positions] % self.block_size]
+        return vals.reshape(idx.shape)
 
-        self.f_next_switch = [next_switch-self.total_time for next_switch in self.f_next_switch]
+    def eval_interpolated(self, t):
+        # the blocks are only evaluated point by point
+        return self.eval(t)
+
+class BlockNoiseSignalNormal(BlockNoiseSignal):
+    '''Independent normally distributed points, as NoiseSignalNormal, generated in blocks'''
+    def __str__(self):
+        return "BlockNoiseSignalNormal(resolution_factor={0}, amplitude={1}, seed={2}, mean{3}, variance{4})".format(self.resolution_factor, self.amplitude, self.random_seed, self.mean, self.variance)
 
-        self.amplitude_sums = [sum(self.f_state[ii]*self.freq_amps[ii] for ii in range(self.total_fluctuators))]
-        self.switching_times = [0.0]
+    def configure_noise(self, amplitude, mean, variance, resolution_factor):
+        self.mean = mean
+        self.variance = variance
+        self.amplitude = amplitude
+        self.resolution_factor = resolution_factor
+        self.std_dev = np.sqrt(variance)
+        self.clear_cache()
 
-        tval = 0.0;
-        while ( tval < self.total_time):
-            # find the fluctuator that is to switch next
-            next_switch_idx = self.f_next_switch.index(min(self.f_next_switch))
-            tval = self.f_next_switch[next_switch_idx]
+    def _make_block(self, k):
+        return self.std_dev*self._generator(k+1).standard_normal(self.block_size) + self.mean
 
-            # update the switching time for this fluctuator
-            self.f_next_switch[next_switch_idx] += self.time_units_per_sec*(-np.log(1-self.rand_switch.uniform())/self.freq_points[next_switch_idx])
+    def eval(self, t):
+        return self._eval_points(t)*self.amplitude
 
-            # update the state of this fluctuator
-            self.f_state[next_switch_idx] *= -1.0
+class BlockNoiseSignalSine(BlockNoiseSignal):
+    '''Sum of sine waves, as NoiseSignalSine, computed in blocks (there is nothing random to draw)'''
+    def __str__(self):
+        return "BlockNoiseSignalSine(resolution_factor={0}, seed={1}".format(self.resolution_factor, self.random_seed)
 
-            # add the switching time and new sum to the lists
-            self.switching_times += [tval]
-            self.amplitude_sums += [self.amplitude_sums[len(self.amplitude_sums)-1] + self.f_state[next_switch_idx]*2.0*self.freq_amps[next_switch_idx]]
+    def configure_noise(self, resolution_factor, freq_list, amp_list, phase_list):
+        self.resolution_factor = resolution_factor
+        self.freq_list = freq_list
+        self.amp_list = amp_list
+        self.phase_list = phase_list
+        self.clear_cache()
+
+    def _make_block(self, k):
+        times = (k*self.block_size + np.arange(self.block_size))/self.resolution_factor
+        freqs = np.asarray(self.freq_list, dtype=float)[:, None]
+        amps = np.asarray(self.amp_list, dtype=float)[:, None]
+        phases = np.asarray(self.phase_list, dtype=float)[:, None]
+        return (amps*np.sin(2*np.pi*freqs*times*self.time_unit + phases)).sum(axis=0)
 
-    # return the value of the noise at the indicated time
     def eval(self, t):
-        tdx = bisect.bisect_left(self.switching_times, t)
-        if ( tdx >= len(self.switching_times) ):
-             tdx -= 1
+        return self._eval_points(t)
 
-        if tdx==0:
-            e_val = self.amplitude_sums[0]*self.amplitude
-        else:
-            e_val = self.amplitude_sums[tdx-1]*self.amplitude
-        return e_val
+class BlockNoiseSignalRandomWalk(BlockNoiseSignal):
+    '''
+    Random walk of +-amplitude steps starting at 0, as NoiseSignalRandomWalk, generated in blocks.
+    Each block first draws how many of its steps go up (Binomial(block_size, 1/2)), then where they are
+    (a random permutation), so the value at the start of block k only needs the up-counts of the blocks
+    before it, not their steps. A running total of the up-counts is kept (one integer per block reached),
+    so the first evaluation at block k costs O(k) binomial draws, and later ones O(1).
+    '''
+    def __str__(self):
+        return "BlockNoiseSignalRandomWalk(resolution_factor={0}, amplitude={1}, seed={2}".format(self.resolution_factor, self.amplitude, self.random_seed)
 
+    def configure_noise(self, amplitude, resolution_factor):
+        self.amplitude = amplitude
+        self.resolution_factor = resolution_factor
+        self._cumulative_ups = [0] # number of up steps before each block
+        self.clear_cache()
+
+    def _start_steps(self, k):
+        # the net number of up steps before block k
+        while len(self._cumulative_ups) <= k:
+            block_ups = self._generator(len(self._cumulative_ups)).binomial(self.block_size, 0.5)
+            self._cumulative_ups.append(self._cumulative_ups[-1] + int(block_ups))
+        return 2*self._cumulative_ups[k] - k*self.block_size
+
+    def _make_block(self, k):
+        generator = self._generator(k+1)
+        ups = generator.binomial(self.block_size, 0.5)
+        steps = -np.ones(self.block_size, dtype=np.int64)
+        steps[generator.permutation(self.block_size)[:ups]] = 1
+        # point i of the block is the start value plus the steps before it
+        net_steps = self._start_steps(k) + np.concatenate(([0], np.cumsum(steps)[:-1]))
+        return self.amplitude*net_steps
 
-    def get_sample_data(self, t):
-        uidx = 0
-        while uidx<len(self.switching_times) and self.switching_times[uidx]<t:
-            uidx += 1
+    def eval(self, t):
+        return self._eval_points(t)
 
-        if uidx>0:
-            lidx = uidx - 1
-        else:
-            lidx = 0
-
-        ltime = self.switching_times[lidx]
-        utime = self.switching_times[uidx]
-        sample_times = [ltime]
-        sample_vals = [self.amplitude_sums[lidx]]
-        if not ltime == utime:
-            sample_times += [utime]
-            sample_vals += [self.amplitude_sums[uidx]]
-
-        while (lidx>0 or (uidx+1)<len(self.switching_times)) and ((len(sample_times)<2) or (utime-ltime)<self.interpolation_time):
-            if lidx>0:
-                lidx -= 1
-                ltime = self.switching_times[lidx]
-                sample_vals = [self.amplitude_sums[lidx]] + sample_vals
-                sample_times = [ltime] + sample_times
-            if (uidx+1)<len(self.switching_times):
-                uidx += 1
-                utime = self.switching_times[uidx]
-                sample_vals += [self.amplitude_sums[uidx]]
-                sample_times += [utime]
-
-        if len(sample_times)<2:
-            raise ValueError("Cannot find enough sample data")
-
-        return sample_times, sample_vals
+class BlockNoiseSignalTelegraph(BlockNoiseSignal):
+    '''
+    Sum of random telegraph fluctuators with a 1/f^exponent spectrum, as NoiseSignalTelegraph, generated
+    in blocks of block_time time_units. Each block draws the number of switches of every fluctuator
+    (Poisson, from its switching rate) and then their times (uniform within the block); a fluctuator's
+    state at the start of block k follows from the parity of its switches in the blocks before it.
+    The running parity is kept bit-packed (total_fluctuators bits per block reached), so the first
+    evaluation at block k costs O(k) Poisson draws, and later ones O(1).
+    '''
+    def __str__(self):
+        return "BlockNoiseSignalTelegraph(amplitude={0}, seed={1}, exponent={2}, total_fluctuators={3}, start_freq={4}, stop_freq={5}, block_time={6})".format(self.amplitude, self.random_seed, self.exponent, self.total_fluctuators, self.start_freq, self.stop_freq, self.block_time)
+
+    def configure_noise(self, exponent, amplitude, total_fluctuators, start_freq, stop_freq, block_time):
+        self.exponent = float(exponent)
+        self.amplitude = float(amplitude / (2.0 * np.pi))
+        self.total_fluctuators = total_fluctuators
+        self.start_freq = float(start_freq)
+        self.stop_freq = float(stop_freq)
+        self.block_time = float(block_time)
+        NoiseSignalTelegraph.create_fluctuators(self)
+        self.freq_amps = np.asarray(self.freq_amps)
+        # switches per time_unit of each fluctuator
+        self.switch_rates = np.asarray(self.freq_points)/self.time_units_per_sec
+        self.initial_state = np.where(self._generator(0).integers(2, size=self.total_fluctuators)==0, 1.0, -1.0)
+        self._start_parity = [np.packbits(np.zeros(self.total_fluctuators, dtype=bool))] # odd number of switches before each block
+        self.clear_cache()
+
+    def _start_state(self, k):
+        while len(self._start_parity) <= k:
+            counts = self._generator(len(self._start_parity)).poisson(self.switch_rates*self.block_time)
+            parity = np.unpackbits(self._start_parity[-1], count=self.total_fluctuators).astype(bool) ^ (counts % 2 == 1)
+            self._start_parity.append(np.packbits(parity))
+        odd = np.unpackbits(self._start_parity[k], count=self.total_fluctuators).astype(bool)
+        return self.initial_state*np.where(odd, -1.0, 1.0)
+
+    def _make_block(self, k):
+        '''Returns (switching times, amplitude sums) for block k, starting with the sum at the start of the block'''
+        generator = self._generator(k+1)
+        counts = generator.poisson(self.switch_rates*self.block_time)
+        block_start = k*self.block_time
+        times = generator.uniform(block_start, block_start + self.block_time, size=counts.sum())
+        fluctuators = np.repeat(np.arange(self.total_fluctuators), counts)
+        order = np.argsort(times)
+        times = times[order]
+        fluctuators = fluctuators[order]
+        # the n-th switch of a fluctuator in this block leaves it in its starting state times (-1)^n
+        by_fluctuator = np.argsort(fluctuators, kind='stable')
+        switch_number = np.empty(len(times), dtype=np.int64)
+        switch_number[by_fluctuator] = np.arange(len(times)) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+        start_state = self._start_state(k)
+        new_state = start_state[fluctuators]*np.where(switch_number % 2 == 0, 1.0, -1.0)
+        start_sum = np.sum(start_state*self.freq_amps)
+        amplitude_sums = start_sum + np.concatenate(([0.], np.cumsum(2.0*new_state*self.freq_amps[fluctuators])))
+        return np.concatenate(([block_start], times)), amplitude_sums
+
+    def eval(self, t):
+        t = self._check_times(t)
+        block_indices = (t//self.block_time).astype(np.int64)
+        if np.ndim(t) == 0:
+            times, sums = self.block(int(block_indices))
+            return sums[np.searchsorted(times, t, side='right')-1]*self.amplitude
+        flat_t = t.ravel()
+        vals = np.empty(flat_t.shape)
+        for k, positions in self._group_by_block(block_indices):
+            times, sums = self.block(k)
+            vals[positions] = sums[np.searchsorted(times, flat_t[positions], side='right')-1]
+        return vals.reshape(t.shape)*self.amplitude
 
 if __name__=='__main__':
     total_time = 1000
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-resolution binning of a count series, for studying how merging rows changes the SNR.
+
+Instead of re-reading the file with merge_lines(num_rows=...) for every merge factor, a
+BinningPyramid is built once from the data: level k holds the counts binned by 2**k, each level
+made from pairwise sums of the one below, so all levels together take less than twice the
+space of the data and O(N) time. Any other merge factor comes from the cumulative sum.
+All the levels are stored in one flat array, which can be a memory-mapped .npy file.
+"""
+
+import numpy as np
+from dataset import Dataset
+from Drift import Drift
+
+
+class BinningPyramid(object):
+    '''
+    ones: the 1 counts per sample; counts: the counts per sample (scalar or array);
+    times: explicit timestamps, or None for the implicit axis t0 + dt*i.
+    max_level: the highest level (merge factor 2**max_level) to build; by default as many as fit the data.
+    path: if given, the levels are stored in a memory-mapped .npy file there instead of in memory.
+    Only full bins are kept, so the leftover samples that don't fill a bin are dropped, as in Dataset.merge.
+    '''
+    def __init__(self, ones, counts=1, times=None, t0=0.0, dt=1.0, max_level=None, path=None):
+        ones = np.asarray(ones)
+        self.samples = len(ones)
+        if max_level is None:
+            max_level = int(np.log2(self.samples)) if self.samples > 0 else 0
+        self.max_level = max_level
+        self.lengths = [self.samples >> level for level in range(max_level + 1)]
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths))).astype(np.int64)
+        self.times = None if times is None else np.asarray(times, dtype=np.float64)
+        self.t0 = t0
+        self.dt = dt
+        self.scalar_counts = np.ndim(counts) == 0
+        self.counts = counts
+        self.ones_levels = self._build(ones, path)
+        if not self.scalar_counts:
+            counts_path = None if path is None else path.replace(".npy", "") + "_counts.npy"
+            self.counts_levels = self._build(np.asarray(counts), counts_path)
+        self._cumulative_ones = None
+        self._cumulative_counts = None
+
+    @classmethod
+    def from_dataset(cls, dataset, max_level=None, path=None):
+        return cls(dataset.ones, dataset.counts, dataset._times, dataset.t0, dataset.dt, max_level, path)
+
+    def __repr__(self):
+        return "BinningPyramid(samples={}, levels={}, max_factor={})".format(self.samples, self.max_level + 1, 2**self.max_level)
+
+    def _build(self, values, path):
+        total = int(self.offsets[-1])
+        if path is None:
+            stack = np.empty(total, dtype=np.uint32)
+        else:
+            stack = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint32, shape=(total,))
+        stack[:self.samples] = values
+        for level in range(1, self.max_level + 1):
+            below = stack[self.offsets[level - 1]:self.offsets[level - 1] + 2*self.lengths[level]]
+            stack[self.offsets[level]:self.offsets[level + 1]] = below.reshape(-1, 2).sum(axis=1)
+        return stack
+
+    def _level_slice(self, stack, level):
+        return stack[self.offsets[level]:self.offsets[level + 1]]
+
+    def binned(self, factor):
+        '''Returns (ones, counts) binned by factor; a view of a level for powers of 2, from cumulative sums otherwise'''
+        level = int(np.log2(factor)) if factor > 0 else -1
+        if factor > 0 and 2**level == factor and level <= self.max_level:
+            ones = self._level_slice(self.ones_levels, level)
+            counts = self.counts*factor if self.scalar_counts else self._level_slice(self.counts_levels, level)
+            return ones, counts
+        if factor < 1 or factor > self.samples:
+            raise ValueError("Merge factor must be between 1 and the number of samples!")
+        if self._cumulative_ones is None:
+            self._cumulative_ones = np.concatenate(([0], np.cumsum(self._level_slice(self.ones_levels, 0), dtype=np.int64)))
+            if not self.scalar_counts:
+                self._cumulative_counts = np.concatenate(([0], np.cumsum(self._level_slice(self.counts_levels, 0), dtype=np.int64)))
+        edges = np.arange(0, (self.samples//factor)*factor + 1, factor)
+        ones = np.diff(self._cumulative_ones[edges])
+        counts = self.counts*factor if self.scalar_counts else np.diff(self._cumulative_counts[edges])
+        return ones, counts
+
+    def dataset(self, factor):
+        '''The data binned by factor as a Dataset; each bin takes the time of its first sample'''
+        ones, counts = self.binned(factor)
+        times = None if self.times is None else self.times[:len(ones)*factor:factor]
+        return Dataset(ones, counts, times, self.t0, self.dt*factor)
+
+    def drift(self, factor):
+        '''A Drift object for the data binned by factor, ready for _dct'''
+        return Drift(self.dataset(factor))
+
+    def sweep(self, factors, analysis):
+        '''Calls analysis(dataset) for the data binned by each factor and returns the results in a list'''
+        return [analysis(self.dataset(factor)) for factor in factors]
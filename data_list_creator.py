@@ -5,14 +5,10 @@ Created on Fri Aug  3 14:07:03 2018
 @author: GA28573
 """
 
-import sys
-#sys.path.append("../../transmon-sim/physical_sim")
-sys.path.append("C:/Users/GA28573/AppData/Local/Continuum/anaconda32/Lib/site-packages/qutip-4.3.1-py3.6-win-amd64.egg/qutip")
 import NoiseSignal2 as _ns
-import qutip as _qt
 import numpy as np
-import pylab as plt
-from helpers import *
+from helpers import compress_gate_list, gate_list_to_string, gate_string_to_list
+#qutip and pylab are slow to import, so they are only imported inside the functions that use them
 
 def create_data(time_per_count, num_samples, num_counts, gate_list, time_unit, noise_type=None, walking_amp=None, telegraph_amp=None, \
                 res=None, freq_list=None, amp_list=None, phase_list=None, start_f=None, stop_f=None, fluctuators=None, plot_noise=False, \
@@ -24,6 +20,7 @@ def create_data(time_per_count, num_samples, num_counts, gate_list, time_unit, n
     #gate_list: gates you want to do for your operation, entered as a list of strings
     #xerr,yerr,zerr: 2D tuples with overrotation amplitude in radians and frequency in Hz
     #constant linear drift: enter in rads/second
+    import qutip as _qt
     rho0 = _qt.operator_to_vector(_qt.ket2dm(_qt.basis(2,0)))
     rho1 = _qt.operator_to_vector(_qt.ket2dm(_qt.basis(2,1)))
     zero_counts = []
@@ -67,11 +64,12 @@ def create_data(time_per_count, num_samples, num_counts, gate_list, time_unit, n
     expected_angle_list = []
         
     compressed_gate_list = compress_gate_list(gate_list)
-    for time in timestamps:
-        noise_at_time = 0
-        if noise_type != None:
-            #print(time/time_unit)
-            noise_at_time = sig[time/time_unit]
+    #evaluate the noise at all the timestamps at once
+    if noise_type != None:
+        noise_values = sig[timestamps/time_unit]
+    else:
+        noise_values = np.zeros(len(timestamps))
+    for time, noise_at_time in zip(timestamps, noise_values):
         rho = rho0
         total_angle = 0
         total_ideal_angle = 0
@@ -169,6 +167,7 @@ def create_data(time_per_count, num_samples, num_counts, gate_list, time_unit, n
             
     
     if plot_noise == True:
+        import pylab as plt
         plt.plot(timestamps, np.asarray(expected_angle_list),label="Ideal Angle",ls='dashed',color='orange')
         plt.plot(timestamps, np.asarray(angle_list), label="Drifting Angle")
         plt.legend()
@@ -243,6 +242,7 @@ def ramsey_experiment(left_gate_list, right_gate_list, L, field_f, transition_f,
     transition_f_list = [] #list of the transition frequency at the start of each experiment set
     detuning_list = [] #list of the detuning at the start of each experiment set
     absolute_time = 0 #seconds
+    import qutip as _qt
     rho0 = _qt.operator_to_vector(_qt.ket2dm(_qt.basis(2,0)))
     rho1 = _qt.operator_to_vector(_qt.ket2dm(_qt.basis(2,1)))
     
@@ -322,7 +322,6 @@ def ramsey_experiment(left_gate_list, right_gate_list, L, field_f, transition_f,
     return np.asarray(ones_counts), np.asarray(time_per_experiment_set), np.asarray(probs), np.asarray(varied_param)
 
 if __name__=='__main__':
-
     gate_string = "(Gx)^25"                                
     #print("Start with string {}".format(gate_string))
     gate_list = gate_string_to_list(gate_string)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Compact container for one run of drift data.
+
+The readers return (ones, zeros, timestamps) triples, although zeros is always counts - ones
+and the timestamps are usually just equally spaced. A Dataset keeps only the ones (as uint8,
+or bit-packed when every sample is a single bit), the counts as a scalar or per-row array,
+and either explicit float64 times or an implicit axis t0 + dt*i. Slicing, merging rows and
+splitting into experiments give new Datasets that share memory with the original where possible.
+"""
+
+import numpy as np
+
+
+class Dataset(object):
+    '''
+    ones: the number of 1 counts per sample (uint8 unless counts > 255), or the np.packbits-packed bits
+        if packed=True (then counts must be 1 and length the number of samples)
+    counts: the number of counts per sample, as a scalar or an array with one entry per sample
+    times: an explicit array of timestamps, or None for the implicit axis t0 + dt*i
+    '''
+    def __init__(self, ones, counts=1, times=None, t0=0.0, dt=1.0, packed=False, length=None):
+        self.packed = packed
+        if packed:
+            if np.ndim(counts) > 0 or counts != 1:
+                raise ValueError("Only single-bit samples (counts=1) can be bit-packed!")
+            self._ones = np.asarray(ones, dtype=np.uint8)
+            self.length = len(self._ones)*8 if length is None else length
+        else:
+            ones = np.asarray(ones)
+            max_counts = np.max(counts) if np.size(counts) > 0 else 1
+            self._ones = ones.astype(np.uint8, copy=False) if max_counts <= 255 else ones
+            self.length = len(self._ones)
+        self.counts = counts if np.ndim(counts) == 0 else np.asarray(counts)
+        if self.counts is not None and np.ndim(self.counts) > 0 and len(self.counts) != self.length:
+            raise ValueError("Must have the same number of counts as samples!")
+        if times is not None:
+            times = np.asarray(times, dtype=np.float64)
+            if len(times) != self.length:
+                raise ValueError("Must have the same number of samples and timestamps!")
+        self._times = times
+        self.t0 = t0
+        self.dt = dt
+
+    @classmethod
+    def from_arrays(cls, ones, zeros, timestamps, rtol=1e-9):
+        '''
+        Makes a Dataset from a reader's (ones, zeros, timestamps). The counts are stored as a scalar if every
+        sample has the same number, and equally spaced timestamps (to rtol) become an implicit time axis.
+        timestamps may also be a (first_time, timestep, num_points) tuple, as from sixteen_bit_lines_backwards.
+        '''
+        ones = np.asarray(ones)
+        counts = ones + np.asarray(zeros)
+        if len(counts) > 0 and np.all(counts == counts[0]):
+            counts = counts[0].item()
+        if isinstance(timestamps, tuple):
+            t0, dt, num_points = timestamps
+            return cls(ones, counts, t0=t0, dt=dt)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(timestamps) > 1:
+            dt = (timestamps[-1] - timestamps[0])/(len(timestamps) - 1)
+            implicit = timestamps[0] + dt*np.arange(len(timestamps))
+            if np.allclose(implicit, timestamps, rtol=0, atol=rtol*abs(dt)*len(timestamps)):
+                return cls(ones, counts, t0=timestamps[0], dt=dt)
+        return cls(ones, counts, times=timestamps)
+
+    def __repr__(self):
+        if self._times is None:
+            axis = "t0={}, dt={}".format(self.t0, self.dt)
+        else:
+            axis = "explicit times"
+        counts = self.counts if np.ndim(self.counts) == 0 else "{}-{}".format(np.min(self.counts), np.max(self.counts))
+        return "Dataset(samples={}, counts={}, {}, packed={})".format(self.length, counts, axis, self.packed)
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def ones(self):
+        if self.packed:
+            return np.unpackbits(self._ones, count=self.length)
+        return self._ones
+
+    @property
+    def zeros(self):
+        return self.counts - self.ones
+
+    @property
+    def fraction(self):
+        '''The fraction of 1 counts in each sample'''
+        return self.ones/self.counts
+
+    @property
+    def times(self):
+        if self._times is not None:
+            return self._times
+        return self.t0 + self.dt*np.arange(self.length)
+
+    @property
+    def timestep(self):
+        '''The (average) spacing between samples'''
+        if self._times is None:
+            return self.dt
+        return (self._times[-1] - self._times[0])/(self.length - 1)
+
+    @property
+    def nbytes(self):
+        nbytes = self._ones.nbytes + np.asarray(self.counts).nbytes
+        if self._times is not None:
+            nbytes += self._times.nbytes
+        return nbytes
+
+    def as_arrays(self):
+        '''Returns (ones, zeros, timestamps), as the readers do'''
+        return self.ones, self.zeros, self.times
+
+    def pack(self):
+        '''Returns a bit-packed copy, for single-bit samples'''
+        if self.packed:
+            return self
+        return Dataset(np.packbits(self._ones), 1, self._times, self.t0, self.dt, packed=True, length=self.length)
+
+    def __getitem__(self, key):
+        '''Slicing gives a Dataset that shares memory with this one (except for bit-packed data not cut on a byte)'''
+        if not isinstance(key, slice):
+            raise TypeError("Datasets can only be sliced; use .ones[i] etc. for single samples")
+        start, stop, step = key.indices(self.length)
+        length = len(range(start, stop, step))
+        counts = self.counts if np.ndim(self.counts) == 0 else self.counts[key]
+        times = None if self._times is None else self._times[key]
+        t0 = self.t0 + self.dt*start
+        dt = self.dt*step
+        if self.packed:
+            if step == 1 and start % 8 == 0:
+                return Dataset(self._ones[start//8:(stop + 7)//8], 1, times, t0, dt, packed=True, length=length)
+            return Dataset(self.ones[key], counts, times, t0, dt)
+        return Dataset(self._ones[key], counts, times, t0, dt)
+
+    def merge(self, factor):
+        '''
+        Sums every factor consecutive samples into one (like merge_lines with more bits per row).
+        Leftover samples at the end that don't fill a whole group are dropped.
+        Each merged sample takes the time of the first sample in its group.
+        '''
+        groups = self.length//factor
+        used = groups*factor
+        ones = self.ones[:used].reshape(groups, factor).sum(axis=1, dtype=np.int64)
+        if np.ndim(self.counts) == 0:
+            counts = self.counts*factor
+        else:
+            counts = self.counts[:used].reshape(groups, factor).sum(axis=1)
+        times = None if self._times is None else self._times[:used:factor]
+        return Dataset(ones, counts, times, self.t0, self.dt*factor)
+
+    def split(self, num_experiments):
+        '''Splits the samples into num_experiments equally long Datasets (views), as sixteen_bit_lines_backwards does'''
+        if self.length % num_experiments != 0:
+            raise ValueError("Points per experiment is a decimal: Either the input number of experiments or the data is incorrect.")
+        points = self.length//num_experiments
+        return [self[index*points:(index + 1)*points] for index in range(num_experiments)]
+
+
+def as_times_and_values(times, values):
+    '''
+    Lets the fitters take a Dataset in place of their (times, values) arguments:
+    if times is a Dataset (and values is None), returns its times and its 0/1 samples.
+    The fitters' likelihood is for single-shot (Bernoulli) samples, so the Dataset must have 1 count per sample;
+    merged data would need a binomial likelihood instead.
+    '''
+    if isinstance(times, Dataset):
+        if values is not None:
+            raise ValueError("Pass either a Dataset or times and values, not both!")
+        if np.any(np.asarray(times.counts) != 1):
+            raise ValueError("The fitters need single-count samples; this Dataset has more than 1 count per sample!")
+        return times.times, times.ones.astype(np.int64)
+    return times, values
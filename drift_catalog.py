@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Catalog of the DRIFT files in a directory tree, kept in a local sqlite index.
+
+Our data lives in dated folders like 2018_08_14/2018_08_14_1030_13_DRIFT.txt or
+2018_08_27 Gi Data/..., so the start time comes from the file name and the gate from the
+folder/file name. Files are parsed in a process pool, and files that haven't changed since
+the last update are skipped.
+
+    catalog = DriftCatalog("drift_catalog.sqlite")
+    catalog.update("N:/Programs/Ions Share/Gate-Set Tomography/DriftAnalysis")
+    for entry in catalog.query(gate='Gi', start='2018-08-01', stop='2018-09-01'):
+        store = entry.load()
+"""
+
+import os
+import re
+import sqlite3
+import fnmatch
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+from drift_file_io import parse_drift_rows, parse_bit_rows
+from drift_store import file_hash, load_store
+
+_START_TIME_PATTERN = re.compile(r'(\d{4})_(\d{2})_(\d{2})_(\d{2})(\d{2})_(\d{2})')
+_GATE_PATTERN = re.compile(r'(?<![A-Za-z])(G[ixyz])(?![a-z])')
+
+_COLUMNS = ('path', 'size', 'mtime', 'checksum', 'start_time', 'first_timestamp', 'rows', 'bits_per_row',
+            'experiments', 'gate')
+
+
+def scan_drift_files(root, pattern='*DRIFT*.txt'):
+    '''Returns the paths of all files under root whose names match pattern'''
+    paths = []
+    for directory, subdirectories, file_names in os.walk(root):
+        for file_name in sorted(file_names):
+            if fnmatch.fnmatch(file_name, pattern):
+                paths.append(os.path.join(directory, file_name))
+    return sorted(paths)
+
+def start_time_from_name(path):
+    '''Returns the ISO start time encoded in a name like 2018_08_14_1030_13_DRIFT.txt, or None'''
+    match = _START_TIME_PATTERN.search(os.path.basename(path))
+    if match is None:
+        return None
+    return datetime.datetime(*[int(group) for group in match.groups()]).isoformat()
+
+def gate_from_path(path):
+    '''Returns the gate (Gi, Gx, Gy or Gz) named in the file or folder names, e.g. "2018_08_27 Gi Data", or None'''
+    for part in reversed(os.path.normpath(path).split(os.sep)):
+        match = _GATE_PATTERN.search(part)
+        if match is not None:
+            return match.group(1)
+    return None
+
+def _row_metadata(data):
+    #(rows, bits per row, first timestamp) of complete, newline-terminated rows
+    if not data.strip():
+        return 0, 0, None
+    try:
+        raw_bits, ones, zeros, timestamps = parse_drift_rows(data)
+        rows = len(ones)
+        bits_per_row = int((ones + zeros).max()) if rows > 0 else 0
+        first_timestamp = float(timestamps[0]) if rows > 0 else None
+        return rows, bits_per_row, first_timestamp
+    except (IndexError, ValueError):
+        #no timestamps (e.g. 16-bit rows); just count the rows and bits
+        rows, bits_per_row = parse_bit_rows(data).shape
+        return rows, bits_per_row, None
+
+def ingest_file(path):
+    '''
+    Parses one DRIFT file and returns a dict with its catalog metadata, or None if it can't be parsed.
+    A cut-off last row (the file is still being written) is left out. Runs in the worker processes.
+    '''
+    stat = os.stat(path)
+    with open(path, 'rb') as file:
+        data = file.read()
+    try:
+        try:
+            #the last row may just be missing its newline
+            rows, bits_per_row, first_timestamp = _row_metadata(data if data.endswith(b'\n') else data + b'\n')
+        except (IndexError, ValueError):
+            if data.endswith(b'\n'):
+                raise
+            rows, bits_per_row, first_timestamp = _row_metadata(data[:data.rfind(b'\n') + 1])
+    except (IndexError, ValueError):
+        return None
+    return {'path': os.path.abspath(path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'checksum': file_hash(path),
+            'start_time': start_time_from_name(path),
+            'first_timestamp': first_timestamp,
+            'rows': int(rows),
+            'bits_per_row': int(bits_per_row),
+            'experiments': None,
+            'gate': gate_from_path(path)}
+
+
+class CatalogEntry(object):
+    '''One row of the catalog. The data is only read when load() is called.'''
+    def __init__(self, **metadata):
+        self.__dict__.update(metadata)
+
+    def __repr__(self):
+        return "CatalogEntry(path={}, start_time={}, rows={}, bits_per_row={}, gate={})".format(self.path, self.start_time, self.rows, self.bits_per_row, self.gate)
+
+    def load(self, bits_per_row=None, reverse_bits=False):
+        '''Returns the memory-mapped DriftStore for this file (built on first use)'''
+        return load_store(self.path, bits_per_row=bits_per_row, reverse_bits=reverse_bits)
+
+
+class DriftCatalog(object):
+    def __init__(self, db_path="drift_catalog.sqlite"):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, size INTEGER, mtime REAL, checksum TEXT, start_time TEXT,
+            first_timestamp REAL, rows INTEGER, bits_per_row INTEGER, experiments INTEGER, gate TEXT)''')
+        self.connection.execute("CREATE INDEX IF NOT EXISTS files_by_start_time ON files (start_time)")
+        self.connection.commit()
+
+    def __repr__(self):
+        return "DriftCatalog(db={}, files={})".format(self.db_path, len(self))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def update(self, root, pattern='*DRIFT*.txt', processes=None):
+        '''
+        Scans root for DRIFT files and (re)ingests new or changed ones in a pool of processes
+        (one per core by default). Returns the number of files that were ingested.
+        Files that can't be parsed are left out, so they are tried again on the next update.
+        '''
+        known = {path: (size, mtime) for path, size, mtime in self.connection.execute("SELECT path, size, mtime FROM files")}
+        changed = []
+        for path in scan_drift_files(root, pattern):
+            stat = os.stat(path)
+            if known.get(os.path.abspath(path)) != (stat.st_size, stat.st_mtime):
+                changed.append(path)
+        if len(changed) == 0:
+            return 0
+        if processes == 1:
+            results = [ingest_file(path) for path in changed]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = list(pool.map(ingest_file, changed))
+        results = [result for result in results if result is not None]
+        self.connection.executemany("INSERT OR REPLACE INTO files ({}) VALUES ({})".format(", ".join(_COLUMNS), ", ".join("?"*len(_COLUMNS))),
+                                    [tuple(result[column] for column in _COLUMNS) for result in results])
+        self.connection.commit()
+        return len(results)
+
+    def set_experiments(self, path, experiments):
+        '''Records how many experiments are merged into a file (it can't be told from the file itself)'''
+        self.connection.execute("UPDATE files SET experiments = ? WHERE path = ?", (experiments, os.path.abspath(path)))
+        self.connection.commit()
+
+    def query(self, gate=None, start=None, stop=None, min_rows=None):
+        '''
+        Returns the CatalogEntry for every file matching all of the given conditions, in order of start time.
+        start, stop: datetimes or ISO strings ('2018-08-14' or '2018-08-14T10:30'); start is inclusive, stop exclusive.
+        '''
+        conditions = []
+        values = []
+        if gate is not None:
+            conditions.append("gate = ?")
+            values.append(gate)
+        if start is not None:
+            conditions.append("start_time >= ?")
+            values.append(start.isoformat() if isinstance(start, datetime.datetime) else start)
+        if stop is not None:
+            conditions.append("start_time < ?")
+            values.append(stop.isoformat() if isinstance(stop, datetime.datetime) else stop)
+        if min_rows is not None:
+            conditions.append("rows >= ?")
+            values.append(min_rows)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        cursor = self.connection.execute("SELECT {} FROM files{} ORDER BY start_time, path".format(", ".join(_COLUMNS), where), values)
+        return [CatalogEntry(**dict(zip(_COLUMNS, row))) for row in cursor]
+
+    def close(self):
+        self.connection.close()
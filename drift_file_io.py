@@ -7,36 +7,238 @@ Created on Tue Aug  7 09:20:17 2018
 
 import numpy as np
 
-def drift_input(file_loc):
+def drift_input(file_loc, block_size=2**26):
     '''
     Returns a 4-D tuple with an array of the raw bit strings,
     an array of the total 1 counts per timestamp, an array of the
     total 0 counts per timestamp, and an array of the timestamp for
     each total count/bitstring
+
+    The file is read as bytes in blocks of about block_size bytes. Blocks
+    where every row has the same fixed-width layout are parsed with NumPy
+    in one go; anything else falls back to parsing row by row.
+    '''
+    raw_bit_arrays = []
+    ones_arrays = []
+    zeros_arrays = []
+    timestamp_arrays = []
+    leftover = b''
+    with open(file_loc, 'rb') as input:
+        while True:
+            block = input.read(block_size)
+            if not block:
+                break
+            block = leftover + block
+            #only parse complete rows; the partial last row is carried over to the next block
+            last_newline = block.rfind(b'\n')
+            if last_newline < 0:
+                leftover = block
+                continue
+            leftover = block[last_newline + 1:]
+            raw_bits, ones, zeros, timestamps = parse_drift_rows(block[:last_newline + 1])
+            raw_bit_arrays.append(raw_bits)
+            ones_arrays.append(ones)
+            zeros_arrays.append(zeros)
+            timestamp_arrays.append(timestamps)
+    if leftover.strip():
+        raw_bits, ones, zeros, timestamps = parse_drift_rows(leftover + b'\n')
+        raw_bit_arrays.append(raw_bits)
+        ones_arrays.append(ones)
+        zeros_arrays.append(zeros)
+        timestamp_arrays.append(timestamps)
+    if len(ones_arrays) == 0:
+        return (np.asarray([]), np.asarray([]), np.asarray([]), np.array([]))
+    return (np.concatenate(raw_bit_arrays), np.concatenate(ones_arrays), np.concatenate(zeros_arrays), np.concatenate(timestamp_arrays))
+
+def parse_drift_rows(data):
     '''
+    Parses complete newline-terminated DRIFT.txt rows (bytes) of the form
+    "<bits>\t<10-char date> HHMM?SS??<msecs>". Returns the same 4-tuple as drift_input.
+    '''
+    parsed = _parse_fixed_width_rows(data)
+    if parsed is None:
+        parsed = _parse_rows(data.decode().splitlines())
+    return parsed
+
+def _parse_fixed_width_rows(data):
+    #returns None if the rows don't all share one fixed-width layout
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == ord('\n'))
+    if len(newlines) == 0:
+        return None
+    row_length = newlines[0] + 1
+    if len(buffer) != row_length*len(newlines) or np.any(np.diff(newlines) != row_length):
+        return None
+    rows = buffer.reshape(len(newlines), row_length)
+    first_row = bytes(rows[0])
+    tab = first_row.find(b'\t')
+    if tab <= 0 or np.any(rows[:, tab] != ord('\t')):
+        return None
+    #the timestamp field runs up to the next tab or the end of the line
+    field_end = len(first_row.rstrip(b'\r\n').split(b'\t')[1]) + tab + 1
+    time_start = tab + 1 + 11
+    if field_end - time_start < 10:
+        return None
+    bits = rows[:, :tab]
+    time = rows[:, time_start:field_end]
+    #unsigned subtraction wraps anything below '0' around, so one comparison checks for digits
+    digits = time - np.uint8(ord('0'))
+    digit_columns = [0, 1, 2, 3, 5, 6] + list(range(9, time.shape[1]))
+    if np.any(digits[:, digit_columns] > 9) or np.any(rows[:, field_end:] != rows[0, field_end:]):
+        return None
+    if np.any((bits == ord(' ')) | (bits == ord('\r'))):
+        return None
+    digits = digits.astype(np.int64)
+    hour = 10*digits[:, 0] + digits[:, 1]
+    minutes = 10*digits[:, 2] + digits[:, 3]
+    seconds = 10*digits[:, 5] + digits[:, 6]
+    msec_digits = digits[:, 9:]
+    msecs = msec_digits.dot(10**np.arange(msec_digits.shape[1] - 1, -1, -1))
+    timestamps = hour*60*60 + minutes*60 + seconds + msecs/1000
+    ones = np.count_nonzero(bits == ord('1'), axis=1)
+    zeros = np.count_nonzero(bits == ord('0'), axis=1)
+    raw_bits = np.ascontiguousarray(bits).view('S{}'.format(tab))[:, 0].astype(str)
+    return (raw_bits, ones, zeros, timestamps)
+
+def _parse_rows(rows):
     raw_bit_list = []
     ones_counts_per_stamp = []
     zeros_counts_per_stamp = []
     timestamps = []
-    with open(file_loc, 'r') as input:
-        for row in input:
-            row = row.split("\t")
-            raw_bits = row[0].strip()
-            time = row[1][11:].strip()
-            hour = int(time[:2])
-            minutes = int(time[2:4])
-            seconds = int(time[5:7])
-            msecs = int(time[9:])
-            time_in_seconds = hour*60*60 + minutes*60 + seconds + msecs/1000
-            #print("{} {} {} {}".format(hour, minutes, seconds, msecs))
-            #print("Time in seconds {}".format(time_in_seconds))
-            raw_bit_list.append(raw_bits)
-            timestamps.append(time_in_seconds)
-            ones = raw_bits.count('1')
-            zeros = raw_bits.count('0')
-            ones_counts_per_stamp.append(ones)
-            zeros_counts_per_stamp.append(zeros)
-    return (np.asarray(raw_bit_list), np.asarray(ones_counts_per_stamp), np.asarray(zeros_counts_per_stamp), np.array(timestamps))  
+    for row in rows:
+        row = row.split("\t")
+        raw_bits = row[0].strip()
+        time = row[1][11:].strip()
+        hour = int(time[:2])
+        minutes = int(time[2:4])
+        seconds = int(time[5:7])
+        msecs = int(time[9:])
+        time_in_seconds = hour*60*60 + minutes*60 + seconds + msecs/1000
+        #print("{} {} {} {}".format(hour, minutes, seconds, msecs))
+        #print("Time in seconds {}".format(time_in_seconds))
+        raw_bit_list.append(raw_bits)
+        timestamps.append(time_in_seconds)
+        ones = raw_bits.count('1')
+        zeros = raw_bits.count('0')
+        ones_counts_per_stamp.append(ones)
+        zeros_counts_per_stamp.append(zeros)
+    return (np.asarray(raw_bit_list), np.asarray(ones_counts_per_stamp), np.asarray(zeros_counts_per_stamp), np.array(timestamps))
+
+def read_bit_rows(file_loc, bits_per_row=None):
+    '''
+    Returns an (nrows x bits_per_row) uint8 array with the bits of each row, in the order they are written in the file.
+    If bits_per_row is None, the bits are the first tab-separated field of each row (as in merge_lines),
+    otherwise they are the first bits_per_row characters of each row (as in sixteen_bit_lines_backwards).
+    Every row must have the same number of bits.
+    '''
+    with open(file_loc, 'rb') as file:
+        data = file.read()
+    if not data.endswith(b'\n'):
+        data += b'\n'
+    return parse_bit_rows(data, bits_per_row)
+
+def parse_bit_rows(data, bits_per_row=None):
+    '''
+    Parses complete newline-terminated rows of bits (bytes) into the same array as read_bit_rows.
+    '''
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == ord('\n'))
+    if len(newlines) == 0:
+        return np.zeros((0, bits_per_row or 0), dtype=np.uint8)
+    row_length = newlines[0] + 1
+    if len(buffer) == row_length*len(newlines) and not np.any(np.diff(newlines) != row_length):
+        #every row has the same layout, so the rows are just a 2-D array of characters
+        rows = buffer.reshape(len(newlines), row_length)
+        if bits_per_row is None:
+            bits_per_row = len(bytes(rows[0]).split(b'\t')[0].strip())
+        bits = rows[:, :bits_per_row] - np.uint8(ord('0'))
+    else:
+        if bits_per_row is None:
+            fields = [line.split(b'\t')[0].strip() for line in data.splitlines() if line.strip()]
+        else:
+            fields = [line[:bits_per_row] for line in data.splitlines() if line.strip()]
+        if len(set(len(field) for field in fields)) > 1:
+            raise ValueError("Every row must have the same number of bits!")
+        bits = np.frombuffer(b''.join(fields), dtype=np.uint8).reshape(len(fields), -1) - np.uint8(ord('0'))
+    if np.any(bits > 1):
+        raise ValueError("Found a character other than 0 or 1 in the bits of a row!")
+    return bits
+
+def iter_bit_rows(file_loc, bits_per_row=None, block_size=2**24):
+    '''
+    Generator version of read_bit_rows: yields (rows x bits_per_row) uint8 arrays for the complete rows
+    in each block of about block_size bytes, carrying a partial last row over to the next block.
+    '''
+    leftover = b''
+    with open(file_loc, 'rb') as file:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                break
+            block = leftover + block
+            last_newline = block.rfind(b'\n')
+            if last_newline < 0:
+                leftover = block
+                continue
+            leftover = block[last_newline + 1:]
+            yield parse_bit_rows(block[:last_newline + 1], bits_per_row)
+    if leftover.strip():
+        yield parse_bit_rows(leftover + b'\n', bits_per_row)
+
+def _iter_bit_chunks(bit_row_blocks, timestep, chunk_size, reverse_rows=False, num_rows=None):
+    #merges blocks of bit rows into one bit string and yields it in chunks of chunk_size bits
+    #the chunks are int64 like the other readers' output, since the fitters do arithmetic like 2*y - 1 on them
+    pending = np.zeros(0, dtype=np.uint8)
+    samples_done = 0
+    rows_done = 0
+    for rows in bit_row_blocks:
+        if num_rows is not None:
+            rows = rows[:num_rows - rows_done]
+        rows_done += len(rows)
+        if reverse_rows:
+            rows = rows[:, ::-1]
+        pending = np.concatenate((pending, rows.reshape(-1)))
+        while len(pending) >= chunk_size:
+            ones = pending[:chunk_size]
+            pending = pending[chunk_size:]
+            timestamps = timestep*np.arange(samples_done + 1, samples_done + chunk_size + 1)
+            samples_done += chunk_size
+            yield (ones.astype(np.int64), np.ones(chunk_size, dtype=np.int64), timestamps)
+        if num_rows is not None and rows_done >= num_rows:
+            break
+    if len(pending) > 0:
+        timestamps = timestep*np.arange(samples_done + 1, samples_done + len(pending) + 1)
+        yield (pending.astype(np.int64), np.ones(len(pending), dtype=np.int64), timestamps)
+
+def iter_merge_lines(file_loc, timestep, chunk_size=2**20, num_rows=None, block_size=2**24):
+    '''
+    Streaming version of merge_lines: every bit of every row is one sample with 1 count, equally spaced by timestep.
+    Yields (ones, counts, timestamps) arrays of chunk_size samples (the last chunk may be shorter),
+    so only about block_size bytes of the file and one chunk are in memory at a time.
+    The n-th sample (counting from 1) is at n*timestep.
+    '''
+    blocks = iter_bit_rows(file_loc, None, block_size)
+    return _iter_bit_chunks(blocks, timestep, chunk_size, num_rows=num_rows)
+
+def iter_sixteen_bit_lines_backwards(file_loc, timestep, chunk_size=2**20, bits_per_row=16, block_size=2**24):
+    '''
+    Streaming version of sixteen_bit_lines_backwards: reads the first bits_per_row bits of each row, reverses them
+    (LabView writes them backwards) and yields the merged bit string as (ones, counts, timestamps) chunks
+    of chunk_size samples. Split the stream into experiments by counting samples.
+    '''
+    blocks = iter_bit_rows(file_loc, bits_per_row, block_size)
+    return _iter_bit_chunks(blocks, timestep, chunk_size, reverse_rows=True)
+
+def iter_experiment_per_line(file_loc, timestep, block_size=2**24):
+    '''
+    Streaming version of experiment_per_line: yields (ones, counts, timestamps) for one row (experiment) at a time.
+    The n-th bit of a row (counting from 1) is at n*timestep. Every row must have the same number of bits.
+    '''
+    for rows in iter_bit_rows(file_loc, None, block_size):
+        timestamps = timestep*np.arange(1, rows.shape[1] + 1)
+        counts = np.ones(rows.shape[1], dtype=np.int64)
+        for row in rows.astype(np.int64):
+            yield (row, counts, timestamps)
 
 def merge_lines(file_loc, timestep, num_rows=None):
     '''
@@ -66,22 +268,22 @@ def merge_lines(file_loc, timestep, num_rows=None):
     timestamps = [i*timestep for i in range(1, num_samples)]
     return (np.asarray(ones_counts_per_stamp), np.asarray(zeros_counts_per_stamp), np.array(timestamps))  
 
-def sixteen_bit_lines_backwards(file_loc, timestep, num_experiments):
+def sixteen_bit_lines_backwards(file_loc, timestep, num_experiments, bits_per_row=16, reverse=True, implicit_times=False):
     '''
     Assumes 16 bits per line. Merges all lines into one bit string of 
     equidistant points. If more than one experiment is merged into the line, the long bitstring
     will be split up into num_experiments of equal length.
+    bits_per_row: how many characters at the start of each line are bits (16 by default).
+    reverse: True to reverse the bits of each line, to undo the LabView bit order; False to keep them as written.
+    implicit_times: if True, the timestamps of each experiment are returned as a (first_time, timestep, num_points)
+        tuple instead of an array.
+    The experiments are views into one array of all the bits, and share one timestamp array.
     '''
-    datasets = []
-    bitstring = []
-    with open(file_loc, 'r') as file:
-        for row in file:
-            row = [int(bit) for bit in row[0:16]]
-            #print("Forward row",row)
-            row = row[::-1]#due to a LabView error, the bits are read in backwards
-            #print("Reversed row", row_list)
-            #print("Row list is",row_list)
-            bitstring.extend(row)
+    rows = read_bit_rows(file_loc, bits_per_row)
+    if reverse:
+        rows = rows[:, ::-1] #due to a LabView error, the bits are read in backwards
+    #int64 like the original output, since the fitters do arithmetic like 2*y - 1 on the samples
+    bitstring = rows.reshape(-1).astype(np.int64)
     
     total_points = len(bitstring)
     points_per_experiment = total_points/num_experiments
@@ -92,11 +294,12 @@ def sixteen_bit_lines_backwards(file_loc, timestep, num_experiments):
         raise ValueError("Points per experiment is a decimal: Either the input number of experiments or the data file is incorrect.")
     else:
         points_per_experiment = int(points_per_experiment)
-    for index in range(num_experiments):
-        data = np.asarray(bitstring[index*points_per_experiment:(index + 1)*points_per_experiment])
-        timestamp_array = np.asarray([i*timestep for i in range(1, points_per_experiment + 1)])
-        set_tuple = (data, 1 - data, timestamp_array)
-        datasets.append(set_tuple)
+    if implicit_times:
+        timestamps = (timestep, timestep, points_per_experiment)
+    else:
+        timestamps = timestep*np.arange(1, points_per_experiment + 1)
+    experiments = bitstring.reshape(num_experiments, points_per_experiment)
+    datasets = [(data, 1 - data, timestamps) for data in experiments]
     return datasets #returns a num_experiment-length list with tuples containing (ones_count_array, zeros_count_array, timestamp_array)
     
     
@@ -149,6 +352,101 @@ def experiment_per_line(file_loc, timestep):
         
     
 
+def _row_blocks(rows, block_rows):
+    #rows is either one 2-D array or an iterable of 2-D arrays (e.g. a generator of simulated chunks)
+    if isinstance(rows, np.ndarray):
+        rows = rows if rows.ndim == 2 else rows.reshape(1, -1)
+        for start in range(0, len(rows), block_rows):
+            yield rows[start:start + block_rows]
+    else:
+        for block in rows:
+            yield np.atleast_2d(np.asarray(block))
+
+def write_bit_rows(file_loc, rows, reverse=False, block_rows=2**16, mode='w'):
+    '''
+    Writes rows of bits (a 2-D array of 0s and 1s, or an iterable of such arrays) to file_loc, one row per line,
+    in the format read by merge_lines, experiment_per_line and read_bit_rows.
+    reverse: True to write the bits of each row backwards, as LabView does (so sixteen_bit_lines_backwards reads them back in order).
+    Each block of block_rows rows is formatted as one byte array and written in one go.
+    mode: 'w' to overwrite the file, 'a' to append to it.
+    '''
+    with open(file_loc, mode + 'b') as file:
+        for block in _row_blocks(rows, block_rows):
+            if reverse:
+                block = block[:, ::-1]
+            lines = np.empty((block.shape[0], block.shape[1] + 1), dtype=np.uint8)
+            lines[:, :-1] = block + ord('0')
+            lines[:, -1] = ord('\n')
+            file.write(lines.tobytes())
+
+def write_sixteen_bit_lines_backwards(file_loc, bitstring, bits_per_row=16, block_rows=2**16):
+    '''
+    Writes one long bit string (e.g. several experiments one after another) as rows of bits_per_row bits,
+    each row written backwards, so sixteen_bit_lines_backwards reads back the same bit string.
+    '''
+    bitstring = np.asarray(bitstring, dtype=np.uint8)
+    if len(bitstring) % bits_per_row != 0:
+        raise ValueError("The bit string must fill a whole number of rows!")
+    write_bit_rows(file_loc, bitstring.reshape(-1, bits_per_row), reverse=True, block_rows=block_rows)
+
+def write_experiment_per_line(file_loc, experiments, block_rows=2**16):
+    '''Writes each experiment's bits (a row of a 2-D array) on its own line, as read by experiment_per_line'''
+    write_bit_rows(file_loc, np.asarray(experiments, dtype=np.uint8), block_rows=block_rows)
+
+def _digits(values, width):
+    #the ASCII digits of non-negative integers, as a (len(values) x width) array
+    powers = 10**np.arange(width - 1, -1, -1, dtype=np.int64)
+    return ((values[:, None]//powers) % 10 + ord('0')).astype(np.uint8)
+
+def write_drift_input(file_loc, rows, timestamps, date='2018/08/14', block_rows=2**16, mode='w'):
+    '''
+    Writes rows of bits with a timestamp each, in the DRIFT.txt format read by drift_input:
+    "<bits>\t<date> HHMM:SS  mmm", where the timestamps are in seconds since midnight (rounded to the ms)
+    and date is any 10-character string. rows may be one 2-D array, or an iterable of 2-D blocks (as in write_bit_rows).
+    timestamps may be one array (or list), which is cut to match the blocks of rows, or an iterator
+    (e.g. a generator) of blocks with the same lengths as the blocks of rows. There must be exactly one timestamp per row.
+    '''
+    date = date.encode()
+    if len(date) != 10:
+        raise ValueError("The date must be 10 characters long, e.g. 2018/08/14")
+    #timestamps that aren't an iterator of blocks are one array, sliced to the length of each block of rows
+    all_timestamps = None if hasattr(timestamps, '__next__') else np.asarray(timestamps, dtype=np.float64).reshape(-1)
+    if all_timestamps is not None and isinstance(rows, np.ndarray) and (len(rows) if rows.ndim == 2 else 1) != len(all_timestamps):
+        raise ValueError("Must have the same number of rows and timestamps!")
+    written = 0
+    prefix = np.frombuffer(b'\t' + date + b' ', dtype=np.uint8)
+    with open(file_loc, mode + 'b') as file:
+        for block in _row_blocks(rows, block_rows):
+            if all_timestamps is None:
+                times = next(timestamps, None)
+            else:
+                times = all_timestamps[written:written + len(block)]
+            if times is None or len(block) != np.size(times):
+                raise ValueError("Must have the same number of rows and timestamps!")
+            written += len(block)
+            nbits = block.shape[1]
+            msecs = np.round(np.asarray(times, dtype=np.float64)*1000).astype(np.int64)
+            if np.any(msecs < 0) or np.any(msecs >= 100*60*60*1000):
+                raise ValueError("Timestamps must be between 0 and 100 hours!")
+            lines = np.empty((block.shape[0], nbits + len(prefix) + 13), dtype=np.uint8)
+            lines[:, :nbits] = block + ord('0')
+            column = nbits + len(prefix)
+            lines[:, nbits:column] = prefix
+            lines[:, column:column + 2] = _digits(msecs//3600000, 2)
+            lines[:, column + 2:column + 4] = _digits(msecs//60000 % 60, 2)
+            lines[:, column + 4] = ord(':')
+            lines[:, column + 5:column + 7] = _digits(msecs//1000 % 60, 2)
+            lines[:, column + 7:column + 9] = ord(' ')
+            lines[:, column + 9:column + 12] = _digits(msecs % 1000, 3)
+            lines[:, -1] = ord('\n')
+            file.write(lines.tobytes())
+        if all_timestamps is None:
+            timestamps_left = next(timestamps, None) is not None
+        else:
+            timestamps_left = written != len(all_timestamps)
+        if timestamps_left:
+            raise ValueError("Must have the same number of rows and timestamps!")
+
 def calculate_average_timestep(timestamp_array):
     differences = []
     for index in range(len(timestamp_array) - 1):         
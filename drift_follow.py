@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Follow a DRIFT file while the acquisition PC is still appending rows to it.
+
+DriftFollower remembers how far into the file it has read, so each refresh only parses the
+rows appended since the last one, instead of re-reading the whole file with drift_input.
+"""
+
+import os
+import time
+import asyncio
+from drift_file_io import parse_drift_rows
+
+
+class PollingBackend(object):
+    '''Waits for changes by sleeping for poll_interval seconds'''
+    def __init__(self, poll_interval=0.5):
+        self.poll_interval = poll_interval
+
+    def wait(self, file_loc, timeout=None):
+        time.sleep(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+
+    def close(self):
+        pass
+
+
+class InotifyBackend(object):
+    '''
+    Waits for changes with Linux inotify (needs the inotify_simple package). Watches the directory
+    of the file, so it also wakes up when the file is rotated (moved away and re-created).
+    '''
+    def __init__(self, file_loc):
+        try:
+            import inotify_simple
+        except ImportError:
+            raise ImportError("InotifyBackend needs the inotify_simple package; use PollingBackend instead.")
+        self._flags = inotify_simple.flags
+        self.inotify = inotify_simple.INotify()
+        watched = self._flags.MODIFY | self._flags.CREATE | self._flags.MOVED_TO | self._flags.CLOSE_WRITE
+        self.inotify.add_watch(os.path.dirname(os.path.abspath(file_loc)) or '.', watched)
+
+    def wait(self, file_loc, timeout=None):
+        #inotify_simple takes the timeout in ms; None waits until something happens
+        self.inotify.read(timeout=None if timeout is None else int(timeout*1000))
+
+    def close(self):
+        self.inotify.close()
+
+
+class DriftFollower(object):
+    '''
+    Reads the rows appended to a DRIFT file since the last read.
+    read_new() returns one batch, in the same format as drift_input: (raw bit strings, ones, zeros, timestamps).
+    A row is only parsed once its newline has been written; a partial last row waits for the next read.
+    If the file is truncated or replaced by a new file with the same name, reading restarts at the
+    beginning of the new file. A half-written row left at the end of the old file is dropped.
+    With from_start=False, reading starts at the end of the file; if that is in the middle of a row,
+    the rest of that row is skipped.
+    Iterate over the follower (or use "async for" in a coroutine) to get batches as they arrive.
+    '''
+    def __init__(self, file_loc, poll_interval=0.5, backend=None, from_start=True, parser=parse_drift_rows):
+        self.file_loc = file_loc
+        self.backend = backend if backend is not None else PollingBackend(poll_interval)
+        self.parser = parser
+        self.file = None
+        self.offset = 0
+        self.leftover = b''
+        self.rows_read = 0
+        self.skip_partial_row = False
+        if not from_start and os.path.exists(file_loc):
+            self._open()
+            self.offset = self.file.seek(0, os.SEEK_END)
+            if self.offset > 0:
+                #if the end of the file is in the middle of a row, skip the rest of that row
+                self.file.seek(self.offset - 1)
+                self.skip_partial_row = self.file.read(1) != b'\n'
+
+    def __repr__(self):
+        return "DriftFollower(file={}, offset={}, rows_read={})".format(self.file_loc, self.offset, self.rows_read)
+
+    def _open(self):
+        self.file = open(self.file_loc, 'rb')
+        self.offset = 0
+        self.leftover = b''
+        self.skip_partial_row = False
+
+    def _rotated(self):
+        #returns 'replaced' if the file at file_loc is not the one we have open, 'truncated' if it has
+        #been truncated, or None if neither
+        try:
+            path_stat = os.stat(self.file_loc)
+        except FileNotFoundError:
+            return None
+        open_stat = os.fstat(self.file.fileno())
+        if (path_stat.st_ino, path_stat.st_dev) != (open_stat.st_ino, open_stat.st_dev):
+            return 'replaced'
+        if path_stat.st_size < self.offset:
+            return 'truncated'
+        return None
+
+    def _complete_last_row(self, fragment):
+        #the old file's last row without a newline, made into a complete row if it parses, otherwise nothing
+        if not fragment.strip():
+            return b''
+        try:
+            self.parser(fragment + b'\n')
+        except (ValueError, IndexError):
+            return b''
+        return fragment + b'\n'
+
+    def _read_available(self):
+        data = self.file.read()
+        self.offset += len(data)
+        return data
+
+    def read_new(self):
+        '''Returns a batch with the complete rows appended since the last read, or None if there are none'''
+        if self.file is None:
+            if not os.path.exists(self.file_loc):
+                return None
+            self._open()
+        data = self.leftover + self._read_available()
+        if self.skip_partial_row:
+            newline = data.find(b'\n')
+            if newline < 0:
+                return None
+            data = data[newline + 1:]
+            self.skip_partial_row = False
+        rotated = self._rotated()
+        if rotated is not None:
+            #finish the complete rows of the old file; a half-written row cut off by truncation is dropped,
+            #but a replaced file may end with a complete last row that has no newline
+            last_newline = data.rfind(b'\n')
+            fragment = data[last_newline + 1:]
+            data = data[:last_newline + 1]
+            if rotated == 'replaced':
+                data += self._complete_last_row(fragment)
+            self.file.close()
+            self._open()
+            batch = self._parse(data)
+            if batch is not None:
+                return batch
+            data = self._read_available()
+        last_newline = data.rfind(b'\n')
+        self.leftover = data[last_newline + 1:]
+        return self._parse(data[:last_newline + 1])
+
+    def _parse(self, data):
+        if not data.strip():
+            return None
+        batch = self.parser(data)
+        self.rows_read += len(batch[1])
+        return batch
+
+    def follow(self, timeout=None):
+        '''
+        Generator that yields each new batch as it arrives. Stops if nothing new has arrived
+        for timeout seconds (never stops if timeout is None).
+        '''
+        last_data_time = time.time()
+        while True:
+            batch = self.read_new()
+            if batch is not None:
+                last_data_time = time.time()
+                yield batch
+                continue
+            if timeout is not None and time.time() - last_data_time > timeout:
+                return
+            self.backend.wait(self.file_loc, timeout)
+
+    def __iter__(self):
+        return self.follow()
+
+    async def afollow(self, timeout=None):
+        '''asyncio version of follow(); the backend waits in a worker thread so the event loop keeps running'''
+        loop = asyncio.get_running_loop()
+        last_data_time = time.time()
+        while True:
+            batch = self.read_new()
+            if batch is not None:
+                last_data_time = time.time()
+                yield batch
+                continue
+            if timeout is not None and time.time() - last_data_time > timeout:
+                return
+            await loop.run_in_executor(None, self.backend.wait, self.file_loc, timeout)
+
+    def __aiter__(self):
+        return self.afollow()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.backend.close()
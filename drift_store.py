@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Packed-bit binary store for DRIFT text files.
+
+A text file is converted once into a directory next to it (<file>.store by default) holding
+    header.json : number of rows, bits per row (nCounts), bit order and the hash of the source file
+    bits.npy    : the bits of every row, packed 8 per byte with np.packbits
+    times.npy   : the float64 timestamp of every row (only for files with timestamps, as in drift_input)
+Later loads memory-map the .npy files, so nothing is read until a slice of rows is asked for,
+and only that slice is unpacked. The store is rebuilt automatically when the source file changes.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+from drift_file_io import drift_input, read_bit_rows
+
+STORE_VERSION = 1
+
+#number of 1 bits in each possible byte, for counting ones without unpacking
+_ONES_PER_BYTE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def file_hash(file_loc, block_size=2**24):
+    '''SHA-1 hex digest of a file's contents, read in blocks of block_size bytes'''
+    digest = hashlib.sha1()
+    with open(file_loc, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DriftStore(object):
+    '''
+    Read-only view of a store made by build_store. Rows are in the order of the file;
+    bits within a row are in time order (already reversed if the store was built with reverse_bits=True).
+    '''
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "header.json"), 'r') as header_file:
+            self.header = json.load(header_file)
+        self.nrows = self.header['nrows']
+        self.nCounts = self.header['nCounts']
+        self.bit_order = self.header['bit_order']
+        self.packed = np.load(os.path.join(store_dir, "bits.npy"), mmap_mode='r')
+        if self.header['has_timestamps']:
+            self.timestamps = np.load(os.path.join(store_dir, "times.npy"), mmap_mode='r')
+        else:
+            self.timestamps = None
+
+    def __repr__(self):
+        return "DriftStore(rows={}, nCounts={}, bit_order={}, timestamps={}, source={})".format(self.nrows, self.nCounts, self.bit_order, self.timestamps is not None, self.header['source'])
+
+    def __len__(self):
+        return self.nrows
+
+    def rows(self, start=None, stop=None):
+        '''Returns the unpacked (rows x nCounts) uint8 bits of rows start to stop'''
+        return np.unpackbits(self.packed[start:stop], axis=1, count=self.nCounts)
+
+    def bits(self, start=None, stop=None):
+        '''Returns the bits of rows start to stop as one bit string, as merge_lines would read them'''
+        return self.rows(start, stop).reshape(-1)
+
+    def ones(self, start=None, stop=None):
+        '''Returns the number of 1 counts in each of rows start to stop, without unpacking them'''
+        #the padding bits at the end of each packed row are always zero, so they don't add to the count
+        return _ONES_PER_BYTE[self.packed[start:stop]].sum(axis=1)
+
+    def zeros(self, start=None, stop=None):
+        return self.nCounts - self.ones(start, stop)
+
+
+def _store_dir(file_loc, store_dir):
+    return store_dir if store_dir is not None else file_loc + ".store"
+
+def build_store(file_loc, store_dir=None, bits_per_row=None, reverse_bits=False):
+    '''
+    Converts a DRIFT text file into a packed-bit store and returns it as a DriftStore.
+    bits_per_row: None to use the whole first tab-separated field of each row (as drift_input and merge_lines do),
+        or the number of leading characters of each row that are bits (16 for sixteen_bit_lines_backwards).
+    reverse_bits: True to reverse the bits of each row before storing them, to undo the LabView bit order.
+    '''
+    store_dir = _store_dir(file_loc, store_dir)
+    timestamps = None
+    bits = None
+    if bits_per_row is None:
+        try:
+            raw_bits, ones, zeros, timestamps = drift_input(file_loc)
+            if len(set(np.char.str_len(raw_bits))) == 1:
+                bits = np.frombuffer(raw_bits.astype(bytes).tobytes(), dtype=np.uint8).reshape(len(raw_bits), -1) - np.uint8(ord('0'))
+        except (IndexError, ValueError):
+            #no timestamps in this file; just read the bits
+            timestamps = None
+    if bits is None:
+        bits = read_bit_rows(file_loc, bits_per_row)
+    if reverse_bits:
+        bits = bits[:, ::-1]
+
+    os.makedirs(store_dir, exist_ok=True)
+    #remove the old header first, so a half-written store is never mistaken for a complete one
+    header_path = os.path.join(store_dir, "header.json")
+    if os.path.exists(header_path):
+        os.remove(header_path)
+    np.save(os.path.join(store_dir, "bits.npy"), np.packbits(bits, axis=1))
+    if timestamps is not None:
+        np.save(os.path.join(store_dir, "times.npy"), np.asarray(timestamps, dtype=np.float64))
+    source_stat = os.stat(file_loc)
+    header = {'version': STORE_VERSION,
+              'source': os.path.abspath(file_loc),
+              'source_hash': file_hash(file_loc),
+              'source_size': source_stat.st_size,
+              'source_mtime': source_stat.st_mtime,
+              'nrows': int(bits.shape[0]),
+              'nCounts': int(bits.shape[1]),
+              'bits_per_row': bits_per_row,
+              'bit_order': 'reversed' if reverse_bits else 'file',
+              'has_timestamps': timestamps is not None}
+    with open(header_path, 'w') as header_file:
+        json.dump(header, header_file, indent=1)
+    return DriftStore(store_dir)
+
+def load_store(file_loc, store_dir=None, bits_per_row=None, reverse_bits=False):
+    '''
+    Returns the DriftStore for a DRIFT text file, building it first if it doesn't exist yet,
+    was built with different options, or the source file has changed since it was built.
+    '''
+    store_dir = _store_dir(file_loc, store_dir)
+    header_path = os.path.join(store_dir, "header.json")
+    if not os.path.exists(header_path):
+        return build_store(file_loc, store_dir, bits_per_row, reverse_bits)
+    with open(header_path, 'r') as header_file:
+        header = json.load(header_file)
+    if header.get('version') != STORE_VERSION or header['bits_per_row'] != bits_per_row or \
+       header['bit_order'] != ('reversed' if reverse_bits else 'file'):
+        return build_store(file_loc, store_dir, bits_per_row, reverse_bits)
+    source_stat = os.stat(file_loc)
+    if source_stat.st_size != header['source_size'] or source_stat.st_mtime != header['source_mtime']:
+        #only hash the file if it looks different; it may have just been touched
+        if source_stat.st_size != header['source_size'] or file_hash(file_loc) != header['source_hash']:
+            return build_store(file_loc, store_dir, bits_per_row, reverse_bits)
+        header['source_mtime'] = source_stat.st_mtime
+        with open(header_path, 'w') as header_file:
+            json.dump(header, header_file, indent=1)
+    return DriftStore(store_dir)
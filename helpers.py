@@ -5,90 +5,136 @@ Created on Fri Aug  3 14:07:03 2018
 @author: GA28573
 """
 
-import sys
-#sys.path.append("../../transmon-sim/physical_sim")
-sys.path.append("C:/Users/GA28573/AppData/Local/Continuum/anaconda32/Lib/site-packages/qutip-4.3.1-py3.6-win-amd64.egg/qutip")
-import NoiseSignal2 as _ns
-import qutip as _qt
+import re as _re
+import heapq as _heapq
+from functools import lru_cache as _lru_cache
 import numpy as np
-from pygsti.extras import drift
-import pylab as plt
+#pyGSTi and pylab are slow to import, so they are only imported inside the functions that use them
+
+_GATE_TOKEN = _re.compile(r'\s*(?:(G[A-Za-z0-9])|(\()|(\))|\^\s*(\d+)|(\S))')
+
+@_lru_cache(maxsize=1024)
+def parse_gate_string(gate_string):
+    #parses a gate string into a tree without expanding any exponents
+    #the tree is a tuple of items, each either a gate name or a (sub-tree, exponent) pair
+    #ex, "Gx(GxGy)^3(Gz)^2" --> ('Gx', (('Gx', 'Gy'), 3), (('Gz',), 2))
+    #groups can be nested, e.g. "((Gx)^2Gy)^10", and an exponent can follow a single gate, e.g. "Gx^5"
+    stack = [[]]
+    for match in _GATE_TOKEN.finditer(gate_string):
+        gate, open_paren, close_paren, exponent, other = match.groups()
+        if gate is not None:
+            stack[-1].append(gate)
+        elif open_paren is not None:
+            stack.append([])
+        elif close_paren is not None:
+            if len(stack) == 1:
+                raise ValueError("Unmatched ')' in gate string {}!".format(gate_string))
+            group = tuple(stack.pop())
+            stack[-1].append((group, 1))
+        elif exponent is not None:
+            if len(stack[-1]) == 0:
+                raise ValueError("Exponent with nothing to raise in gate string {}!".format(gate_string))
+            last = stack[-1][-1]
+            if isinstance(last, str):
+                stack[-1][-1] = ((last,), int(exponent))
+            else:
+                stack[-1][-1] = (last[0], last[1]*int(exponent))
+        elif other is not None:
+            raise ValueError("Unexpected '{}' in gate string {}!".format(other, gate_string))
+    if len(stack) != 1:
+        raise ValueError("Unmatched '(' in gate string {}!".format(gate_string))
+    return tuple(stack[0])
+
+def _append_run(runs, gate, count):
+    if count == 0:
+        return
+    if runs and runs[-1][0] == gate:
+        runs[-1] = (gate, runs[-1][1] + count)
+    else:
+        runs.append((gate, count))
+
+def _tree_runs(tree):
+    runs = []
+    for item in tree:
+        if isinstance(item, str):
+            _append_run(runs, item, 1)
+            continue
+        group, exponent = item
+        body = _tree_runs(group)
+        if exponent == 0 or len(body) == 0:
+            continue
+        if len(body) == 1:
+            #(Gx)^N is a single run, whatever N is
+            _append_run(runs, body[0][0], body[0][1]*exponent)
+        elif body[0][0] == body[-1][0]:
+            #the end of each repeat joins onto the start of the next one
+            _append_run(runs, *body[0])
+            joined = (body[0][0], body[-1][1] + body[0][1])
+            for repeat in range(exponent - 1):
+                runs.extend(body[1:-1])
+                runs.append(joined)
+            runs.extend(body[1:-1])
+            runs.append(body[-1])
+        else:
+            _append_run(runs, *body[0])
+            runs.extend(body[1:])
+            for repeat in range(exponent - 1):
+                runs.extend(body)
+    return runs
+
+@_lru_cache(maxsize=1024)
+def gate_string_to_runs(gate_string):
+    #returns the gate sequence run-length encoded, as a tuple of (gate, repetitions) pairs
+    #ex, "Gx(Gy)^100000Gy" --> (('Gx', 1), ('Gy', 100001))
+    return tuple(_tree_runs(parse_gate_string(gate_string)))
+
+def gate_tree_length(tree):
+    #total number of gates in a parsed gate string, without expanding it
+    return sum(1 if isinstance(item, str) else gate_tree_length(item[0])*item[1] for item in tree)
+
+def gate_string_length(gate_string):
+    return gate_tree_length(parse_gate_string(gate_string))
 
 def gate_string_to_list(gate_string):
     #returns gate sequence as a list
-    #ex, 'GxGxGx' --> ['Gx', 'Gx', 'Gx', 'Gx']
+    #ex, 'GxGxGx' --> ['Gx', 'Gx', 'Gx']
     #"Gx(Gy)^2Gz" --> ['Gx', 'Gy', 'Gy', 'Gz']
-    #do not raise anything to the 1 exponent, only 2 or more; always use parenthesis
-    #currently can only handle exponents up to 99
-    #do not put more than one gate in parentheses for right now
+    #"(GxGy)^2" --> ['Gx', 'Gy', 'Gx', 'Gy']
+    #use gate_string_to_runs instead to avoid expanding long sequences
     gate_list = []
-                
-    string_list = list(gate_string)
-    list_len = len(string_list)
-    for char_index in range(list_len):
-        char = string_list[char_index]
-        #print("Index {}: {}".format(char_index, char))
-        if char == ")":
-            num = ''
-            start_num = False
-            #do a loop to find the start and end of the exponent number
-            for sub_index in range(char_index, list_len):
-                sub_char = string_list[sub_index]
-                if sub_char.isnumeric():
-                    num = num + sub_char
-                    start_num = True
-                elif not(sub_char.isnumeric()) and start_num == True:
-                    break
-            #print("Found number " + num)
-            last_gate = gate_list[-1]
-            gate_list += [last_gate]*(int(num)-1)
-        if char == "G":
-            gate = char + string_list[char_index + 1]
-            gate_list.append(gate)
+    for gate, count in gate_string_to_runs(gate_string):
+        gate_list += [gate]*count
     return gate_list
 
 def gate_list_to_string(gate_list):
+    #takes a list of single gates, a compressed list of [gate, repetitions] pairs, or a gate string
+    if isinstance(gate_list, str):
+        runs = gate_string_to_runs(gate_list)
+    elif len(gate_list) > 0 and not isinstance(gate_list[0], str):
+        runs = gate_list
+    else:
+        runs = compress_gate_list(gate_list)
     gate_string = ''
-    #check if gate_list is in compressed form
-    if type(gate_list[0]) == list:
-        for gate in gate_list:
-            num = gate[1]
-            name = gate[0]
-            if num > 1:
-                gate_string = gate_string + '(' + name + ')^' + str(num)
-            if num == 1:
-                gate_string = gate_string + name
-    #treat the gate_list as a list with each element as a single gate in string form
-    if type(gate_list[0]) == str:
-        total_gates = len(gate_list)
-        count = 1
-        for gate_index in range(total_gates):
-            gate = gate_list[gate_index]
-            #print("Gate {}: {}".format(gate_index, gate))
-            if gate_index != (total_gates-1) and gate_list[gate_index + 1] == gate:
-                count += 1
-            elif count > 1:
-                gate_string = gate_string + "(" + gate + ")^" + str(count)
-                count = 1
-            else:
-                gate_string = gate_string + gate
-                count = 1
+    for name, num in runs:
+        if num > 1:
+            gate_string = gate_string + '(' + name + ')^' + str(num)
+        if num == 1:
+            gate_string = gate_string + name
     return gate_string
 
 def compress_gate_list(gate_list):
     #this will compress the gate_list down to a list of 2-element lists, where the first element is the gate
     # and the second element is the number of consecutive appearances. The for loop below runs faster
     # when it can read the gates this way.
-    num_gates = len(gate_list)
+    #a gate string can be passed in directly, and is compressed without expanding it
+    if isinstance(gate_list, str):
+        return [list(run) for run in gate_string_to_runs(gate_list)]
     compressed_list = []
-    for i in range(num_gates):
-        if i==0:
-            compressed_list.append([gate_list[i], 1])
+    for gate in gate_list:
+        if compressed_list and compressed_list[-1][0] == gate:
+            compressed_list[-1][1] += 1
         else:
-            if gate_list[i]==gate_list[i-1]:
-                compressed_list[-1][1] += 1
-            else:
-                compressed_list.append([gate_list[i], 1])
+            compressed_list.append([gate, 1])
     return compressed_list
 
 def create_sorted_tuples(x, y, x_limits=None):
@@ -118,17 +164,125 @@ def create_sorted_tuples(x, y, x_limits=None):
     sorted_groups = sorted(grouped, key=lambda tup: tup[1], reverse=True)
     return sorted_groups
 
+def _nearest_indices(sorted_frequencies, order, targets):
+    #index into sorted_frequencies of the closest frequency to each target, where order is the argsort of the frequencies
+    #ties go to the frequency that came first in the original order, as with list.index(min(...))
+    if len(sorted_frequencies) == 1:
+        return np.zeros(len(targets), dtype=np.int64)
+    right = np.clip(np.searchsorted(sorted_frequencies, targets, side='left'), 1, len(sorted_frequencies) - 1)
+    #the first of a run of repeated frequencies is the one that came first, as the sort is stable
+    left = np.searchsorted(sorted_frequencies, sorted_frequencies[right - 1], side='left')
+    right_distance = np.abs(targets - sorted_frequencies[right])
+    left_distance = np.abs(targets - sorted_frequencies[left])
+    right_closer = (right_distance < left_distance) | ((right_distance == left_distance) & (order[right] < order[left]))
+    return np.where(right_closer, right, left)
+
+def _candidate_pairs(sorted_frequencies, targets, tolerance):
+    #all (target, sorted frequency index) pairs within tolerance of each other, or every pair if tolerance is None
+    if tolerance is None:
+        starts = np.zeros(len(targets), dtype=np.int64)
+        stops = np.full(len(targets), len(sorted_frequencies), dtype=np.int64)
+    else:
+        starts = np.searchsorted(sorted_frequencies, targets - tolerance, side='left')
+        stops = np.searchsorted(sorted_frequencies, targets + tolerance, side='right')
+    counts = stops - starts
+    target_indices = np.repeat(np.arange(len(targets)), counts)
+    frequency_indices = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    return target_indices, frequency_indices
+
+def _greedy_matches(sorted_frequencies, targets, tolerance, neighbours):
+    #greedy one-to-one matching using only the frequencies in a window of neighbours sorted indices on each side of each target
+    #a window pair is kept only if it is closer than everything outside the window, so the kept pairs are each target's
+    #nearest frequencies and the greedy choices are the same as with every pair
+    #returns the matches (indices into sorted_frequencies) and which unmatched targets may have a match outside the window
+    n = len(sorted_frequencies)
+    position = np.searchsorted(sorted_frequencies, targets)
+    starts = np.maximum(position - neighbours, 0)
+    stops = np.minimum(position + neighbours, n)
+    outside = np.full(len(targets), np.inf)
+    has_left = starts > 0
+    outside[has_left] = targets[has_left] - sorted_frequencies[starts[has_left] - 1]
+    has_right = stops < n
+    outside[has_right] = np.minimum(outside[has_right], sorted_frequencies[stops[has_right]] - targets[has_right])
+    if tolerance is not None:
+        starts = np.maximum(starts, np.searchsorted(sorted_frequencies, targets - tolerance, side='left'))
+        stops = np.minimum(stops, np.searchsorted(sorted_frequencies, targets + tolerance, side='right'))
+    counts = np.maximum(stops - starts, 0)
+    target_indices = np.repeat(np.arange(len(targets)), counts)
+    frequency_indices = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    distances = np.abs(sorted_frequencies[frequency_indices] - targets[target_indices])
+    kept = distances < outside[target_indices]
+    target_indices, frequency_indices, distances = target_indices[kept], frequency_indices[kept], distances[kept]
+    matches = np.full(len(targets), -1, dtype=np.int64)
+    used = np.zeros(n, dtype=bool)
+    unmatched = len(targets)
+    for pair in np.lexsort((frequency_indices, target_indices, distances)):
+        target, frequency = target_indices[pair], frequency_indices[pair]
+        if matches[target] == -1 and not used[frequency]:
+            matches[target] = frequency
+            used[frequency] = True
+            unmatched -= 1
+            if unmatched == 0:
+                break
+    truncated = (matches == -1) & np.isfinite(outside)
+    if tolerance is not None:
+        truncated &= outside <= tolerance
+    return matches, truncated
+
+def match_frequencies(frequencies, targets, tolerance=None, assignment=None):
+    '''
+    Finds the index of the closest of frequencies (e.g. detected peaks) to each of targets (e.g. injected frequencies).
+    The frequencies are sorted once and every target is looked up with np.searchsorted.
+    tolerance: targets with no frequency within tolerance get no match
+    assignment: None lets several targets match the same frequency;
+        'greedy' matches one-to-one, taking the closest remaining pair each time; each target starts with only its
+            nearest few frequencies as candidates, and the window is widened only if a target is left without a match;
+        'hungarian' matches one-to-one with the smallest total distance (needs scipy)
+    Returns an integer array with the index into frequencies for each target, or -1 where there is no match.
+    '''
+    frequencies = np.asarray(frequencies, dtype=float)
+    targets = np.atleast_1d(np.asarray(targets, dtype=float))
+    matches = np.full(len(targets), -1, dtype=np.int64)
+    if len(frequencies) == 0 or len(targets) == 0:
+        return matches
+    order = np.argsort(frequencies, kind='stable')
+    sorted_frequencies = frequencies[order]
+    if assignment is None:
+        nearest = _nearest_indices(sorted_frequencies, order, targets)
+        within = np.ones(len(targets), dtype=bool) if tolerance is None else np.abs(sorted_frequencies[nearest] - targets) <= tolerance
+        matches[within] = order[nearest[within]]
+        return matches
+    if assignment == 'greedy':
+        neighbours = 4
+        while True:
+            nearest, truncated = _greedy_matches(sorted_frequencies, targets, tolerance, neighbours)
+            if not truncated.any():
+                break
+            neighbours *= 2
+        matched = nearest >= 0
+        matches[matched] = order[nearest[matched]]
+    elif assignment == 'hungarian':
+        from scipy.optimize import linear_sum_assignment
+        target_indices, frequency_indices = _candidate_pairs(sorted_frequencies, targets, tolerance)
+        distances = np.abs(sorted_frequencies[frequency_indices] - targets[target_indices])
+        #pairs outside the tolerance get a cost larger than any allowed pair, and are dropped afterwards
+        #only the frequencies that are close to some target need a column
+        too_far = 2*distances.max() + 1 if len(distances) > 0 else 1.
+        candidates, columns = np.unique(frequency_indices, return_inverse=True)
+        costs = np.full((len(targets), len(candidates)), too_far)
+        costs[target_indices, columns] = distances
+        rows, columns = linear_sum_assignment(costs)
+        allowed = costs[rows, columns] < too_far
+        matches[rows[allowed]] = order[candidates[columns[allowed]]]
+    else:
+        raise ValueError("assignment must be None, 'greedy' or 'hungarian'!")
+    return matches
+
 def select_tuples(sorted_list_of_tuples, x_values_list):
     #picks out N-tuples from the N-length values list
-    #picks out the tuples whose x-value is in x_values_list
-    tuples_of_interest = []
-    for x in x_values_list:
-        difference_list = [] #a list that will be filled with abs(x - tup[0]) for all tuples
-        for tup in sorted_list_of_tuples:
-            difference_list.append(abs(x - tup[0]))
-        index_of_closest_x = difference_list.index(min(difference_list))
-        tuples_of_interest.append(sorted_list_of_tuples[index_of_closest_x])
-    return tuples_of_interest
+    #picks out the tuples whose x-value is closest to each value in x_values_list
+    indices = match_frequencies([tup[0] for tup in sorted_list_of_tuples], x_values_list)
+    return [sorted_list_of_tuples[index] for index in indices]
 
 def RMS(powers_list):
     #calculates RMS average for a list of powers
@@ -248,6 +402,208 @@ def above_and_below(central_freq, frequencies, powers):
     return summed_power, lower, upper, closest_index
             
 
+#The functions below are array versions of RMS, RMSE_comparison, find_band_power, SNR and find_multi_max_power
+#for a whole stack of spectra at once: powers is an (experiments x frequencies) array, frequencies is either
+#shared by all rows or has the same shape as powers, and the band edges can be scalars or one per row.
+#A band (low, high) holds the frequencies low < f <= high, as in SNR.
+
+def _band_mask(frequencies, powers, low_bound, high_bound):
+    powers = np.atleast_2d(np.asarray(powers, dtype=float))
+    frequencies = np.asarray(frequencies, dtype=float)
+    low_bound = np.reshape(low_bound, (-1, 1)) if np.ndim(low_bound) > 0 else low_bound
+    high_bound = np.reshape(high_bound, (-1, 1)) if np.ndim(high_bound) > 0 else high_bound
+    mask = (frequencies > low_bound) & (frequencies <= high_bound)
+    return powers, np.broadcast_to(mask, powers.shape)
+
+def batch_RMS(powers):
+    #RMS of each row of powers
+    powers = np.atleast_2d(np.asarray(powers, dtype=float))
+    return np.sqrt(np.mean(powers**2, axis=1))
+
+def batch_RMSE_comparison(data1, data2):
+    #RMSE_comparison of each row of data1 with the same row of data2 (or with data2 itself if it is one row)
+    data1 = np.atleast_2d(np.asarray(data1, dtype=float))
+    data2 = np.asarray(data2, dtype=float)
+    if data1.shape[-1] != data2.shape[-1]:
+        raise ValueError("Both RMSE objects must be the same length!")
+    return np.sqrt(np.sum((data1 - data2)**2, axis=1))/data1.shape[1]
+
+def batch_band_power(frequencies, powers, low_bound, high_bound):
+    #total power in the band of each row
+    powers, mask = _band_mask(frequencies, powers, low_bound, high_bound)
+    return np.where(mask, powers, 0).sum(axis=1)
+
+def batch_SNR(frequencies, powers, central_freq, freq_band):
+    #SNR of each row: the power within freq_band of central_freq, divided by the RMS of all the row's powers
+    central_freq = np.asarray(central_freq, dtype=float)
+    return batch_band_power(frequencies, powers, central_freq - freq_band, central_freq + freq_band)/batch_RMS(powers)
+
+def batch_multi_max_power(frequencies, powers, low_bound, high_bound, num_powers):
+    #sum of the num_powers highest powers in the band of each row (of all of them, if the band has fewer)
+    powers, mask = _band_mask(frequencies, powers, low_bound, high_bound)
+    in_band = np.where(mask, powers, -np.inf)
+    num_powers = min(num_powers, powers.shape[1])
+    highest = -np.partition(-in_band, num_powers - 1, axis=1)[:, :num_powers]
+    return np.where(np.isfinite(highest), highest, 0).sum(axis=1)
+
+def figures_of_merit(frequencies, powers, central_freq, freq_band, num_powers=2):
+    '''
+    Computes the RMS, band power, SNR, top num_powers power sum and max power for every row of a stack of
+    spectra in one call, with the band central_freq +/- freq_band (scalars, or one per row).
+    Returns a numpy structured array with one record per row and the fields
+        central_freq, freq_band, rms, band_power, snr, top_power_sum, max_power
+    so results['snr'] is the column of SNRs.
+    '''
+    powers = np.atleast_2d(np.asarray(powers, dtype=float))
+    rows = powers.shape[0]
+    central_freq = np.broadcast_to(np.asarray(central_freq, dtype=float), (rows,))
+    freq_band = np.broadcast_to(np.asarray(freq_band, dtype=float), (rows,))
+    low_bound = central_freq - freq_band
+    high_bound = central_freq + freq_band
+    results = np.zeros(rows, dtype=[('central_freq', float), ('freq_band', float), ('rms', float), ('band_power', float),
+                                     ('snr', float), ('top_power_sum', float), ('max_power', float)])
+    results['central_freq'] = central_freq
+    results['freq_band'] = freq_band
+    results['rms'] = batch_RMS(powers)
+    results['band_power'] = batch_band_power(frequencies, powers, low_bound, high_bound)
+    results['snr'] = results['band_power']/results['rms']
+    results['top_power_sum'] = batch_multi_max_power(frequencies, powers, low_bound, high_bound, num_powers)
+    powers, mask = _band_mask(frequencies, powers, low_bound, high_bound)
+    results['max_power'] = np.where(mask, powers, -np.inf).max(axis=1)
+    return results
+
+
+class SpectrumIndex(object):
+    '''
+    Built once for a spectrum, then answers band queries with np.searchsorted in O(log N) instead of
+    scanning the whole frequency list each time like the functions above.
+    A band (low, high) holds the frequencies low < f <= high, as in SNR and find_max_power. find_band_power
+    leaves out a frequency equal to high; pass include_high=False to band and band_power to match it.
+    Indices returned are indices into the frequencies/powers as they were passed in, even if they weren't sorted.
+    '''
+    def __init__(self, frequencies, powers):
+        frequencies = np.asarray(frequencies, dtype=float)
+        powers = np.asarray(powers, dtype=float)
+        if len(frequencies) != len(powers):
+            raise ValueError("Must have the same number of frequencies and powers!")
+        if np.all(frequencies[1:] >= frequencies[:-1]):
+            self.order = None
+        else:
+            self.order = np.argsort(frequencies, kind='stable')
+            frequencies = frequencies[self.order]
+            powers = powers[self.order]
+        self.frequencies = frequencies
+        self.powers = powers
+        self.cumulative_powers = np.concatenate(([0.], np.cumsum(powers)))
+        self.rms = np.sqrt(np.mean(powers**2)) if len(powers) > 0 else 0.
+        self._max_table = None
+
+    def __repr__(self):
+        return "SpectrumIndex(frequencies={}, from {} to {})".format(len(self.frequencies), self.frequencies[0], self.frequencies[-1])
+
+    def __len__(self):
+        return len(self.frequencies)
+
+    def _original_index(self, index):
+        return index if self.order is None else self.order[index]
+
+    def band(self, low_bound, high_bound, include_high=True):
+        '''
+        Returns (start, stop) so that frequencies[start:stop] (sorted) are the frequencies in the band.
+        include_high=False leaves out a frequency equal to high_bound (low < f < high).
+        '''
+        start = np.searchsorted(self.frequencies, low_bound, side='right')
+        stop = np.searchsorted(self.frequencies, high_bound, side='right' if include_high else 'left')
+        return start, np.maximum(start, stop)
+
+    def band_power(self, low_bound, high_bound, include_high=True):
+        '''
+        Sum of the powers in the band; low_bound and high_bound may be arrays of bands.
+        With include_high=False this is the power find_band_power returns (low < f < high).
+        '''
+        start, stop = self.band(low_bound, high_bound, include_high)
+        return self.cumulative_powers[stop] - self.cumulative_powers[start]
+
+    def _build_max_table(self):
+        #sparse table: level k holds the index of the largest power in powers[i:i + 2**k]
+        levels = [np.arange(len(self.powers), dtype=np.int64)]
+        width = 1
+        while 2*width <= len(self.powers):
+            below = levels[-1]
+            left = below[:len(below) - width]
+            right = below[width:]
+            levels.append(np.where(self.powers[right] > self.powers[left], right, left))
+            width *= 2
+        self._max_table = levels
+
+    def _range_argmax(self, start, stop):
+        if self._max_table is None:
+            self._build_max_table()
+        level = int(stop - start).bit_length() - 1
+        left = self._max_table[level][start]
+        right = self._max_table[level][stop - 2**level]
+        return right if self.powers[right] > self.powers[left] else left
+
+    def band_max(self, low_bound, high_bound):
+        '''Returns (power, frequency, index) of the largest power in the band'''
+        start, stop = self.band(low_bound, high_bound)
+        if stop <= start:
+            raise ValueError("No frequencies between {} and {}!".format(low_bound, high_bound))
+        index = self._range_argmax(start, stop)
+        return self.powers[index], self.frequencies[index], self._original_index(index)
+
+    def _top_k_positions(self, low_bound, high_bound, k):
+        start, stop = self.band(low_bound, high_bound)
+        selected = []
+        if stop > start and k > 0:
+            #each heap entry is the largest power of a range that hasn't been split yet
+            index = self._range_argmax(start, stop)
+            heap = [(-self.powers[index], index, start, stop)]
+            while heap and len(selected) < k:
+                power, index, range_start, range_stop = _heapq.heappop(heap)
+                selected.append(index)
+                for sub_start, sub_stop in ((range_start, index), (index + 1, range_stop)):
+                    if sub_stop > sub_start:
+                        sub_index = self._range_argmax(sub_start, sub_stop)
+                        _heapq.heappush(heap, (-self.powers[sub_index], sub_index, sub_start, sub_stop))
+        return np.asarray(selected, dtype=np.int64)
+
+    def top_k(self, low_bound, high_bound, k):
+        '''
+        Returns the indices of the k largest powers in the band, from largest to smallest
+        (fewer than k if the band is smaller). Takes O(k log k) once the sparse table is built.
+        '''
+        return self._original_index(self._top_k_positions(low_bound, high_bound, k))
+
+    def top_k_sum(self, low_bound, high_bound, k):
+        '''Sum of the k largest powers in the band, as find_multi_max_power'''
+        return self.powers[self._top_k_positions(low_bound, high_bound, k)].sum()
+
+    def nearest(self, freq_of_interest):
+        '''Returns (closest frequency, its index), as find_closest_frequency; freq_of_interest may be an array'''
+        right = np.clip(np.searchsorted(self.frequencies, freq_of_interest, side='left'), 1, max(len(self.frequencies) - 1, 1))
+        left = right - 1
+        #ties go to the lower frequency, as with list.index(min(...))
+        index = np.where(np.abs(self.frequencies[right] - freq_of_interest) < np.abs(freq_of_interest - self.frequencies[left]), right, left)
+        if len(self.frequencies) == 1:
+            index = np.zeros_like(index)
+        return self.frequencies[index], self._original_index(index)
+
+    def above_and_below(self, central_freq):
+        '''Returns (summed |power|, lower frequency, upper frequency, index of the closer one), as above_and_below'''
+        upper_index = np.searchsorted(self.frequencies, central_freq, side='right')
+        if upper_index == 0 or upper_index == len(self.frequencies):
+            raise ValueError("{} is not between two frequencies of the spectrum!".format(central_freq))
+        upper = self.frequencies[upper_index]
+        lower = self.frequencies[upper_index - 1]
+        summed_power = abs(self.powers[upper_index]) + abs(self.powers[upper_index - 1])
+        closest_index = upper_index if upper - central_freq < central_freq - lower else upper_index - 1
+        return summed_power, lower, upper, self._original_index(closest_index)
+
+    def snr(self, central_freq, freq_band):
+        '''Total power within freq_band of central_freq divided by the RMS of all the powers, as SNR'''
+        return self.band_power(central_freq - freq_band, central_freq + freq_band)/self.rms
+
 def single_frequency_reconstruction(drifted, low_freq, high_freq, \
                                     print_info=False, plot_original=False, plot_results=False): 
     #requires a Drift object as the input
@@ -256,6 +612,9 @@ def single_frequency_reconstruction(drifted, low_freq, high_freq, \
     and does the IDCT of just that frequency and its power. Returns a plot showing the
     probability as a function of time.
     '''
+    from pygsti.extras import drift
+    if print_info or plot_original or plot_results:
+        import pylab as plt
     #copy relevant info from the drift object
     all_frequencies = list(drifted.frequencies)
     all_modes = drifted.pspepo_modes[0,0,1,:]
@@ -337,6 +696,9 @@ def multi_frequency_reconstruction(drifted, central_freq, tolerance_band,\
     Returns a plot showing the probability as a function of time and a calculated amplitude of the
     probability oscillation about the mean.
     '''
+    from pygsti.extras import drift
+    if print_info or plot_original or plot_results:
+        import pylab as plt
     #copy relevant info from the drift object
     all_frequencies = list(drifted.frequencies)
     all_modes = drifted.pspepo_modes[0,0,1,:]
@@ -419,6 +781,39 @@ def multi_frequency_reconstruction(drifted, central_freq, tolerance_band,\
         print("Frequency: {:.3f} Hz\nAmplitude: {:.3f}".format(closest_freq, amplitude))
     
     return my_reconstruction, closest_freq, amplitude
+
+def batch_multi_frequency_reconstruction(drifted, central_freqs, tolerance_bands, renormalize='logistic'):
+    #requires a pyGSTi drift results object as the input, as multi_frequency_reconstruction
+    '''
+    multi_frequency_reconstruction for many bands at once: central_freqs and tolerance_bands are arrays
+    (or a scalar tolerance for all of them). The modes, powers and null hypothesis are computed once,
+    the two highest peaks of every band are merged together, and all the traces are reconstructed in
+    a single batched IDCT.
+    Returns (closest_freqs, amplitudes, traces) with one entry (one row of traces) per band.
+    '''
+    from Drift import idct_reconstruction
+    central_freqs = np.atleast_1d(np.asarray(central_freqs, dtype=float))
+    tolerance_bands = np.broadcast_to(np.asarray(tolerance_bands, dtype=float), central_freqs.shape)
+    frequencies = np.asarray(drifted.frequencies, dtype=float)
+    all_modes = np.asarray(drifted.pspepo_modes[0,0,1,:], dtype=float)
+    data = np.asarray(drifted.data[0,0,1,:], dtype=float)
+    nCounts = drifted.number_of_counts
+    null_hypothesis = np.mean(data)/nCounts
+
+    #merge the two highest powers of each band, as in multi_frequency_reconstruction
+    in_band = (frequencies > (central_freqs - tolerance_bands)[:, None]) & (frequencies < (central_freqs + tolerance_bands)[:, None])
+    if np.any(in_band.sum(axis=1) < 2):
+        raise ValueError("Every band must hold at least two frequencies!")
+    band_powers = np.where(in_band, all_modes**2, -np.inf)
+    highest_two = np.argpartition(-band_powers, 1, axis=1)[:, :2]
+    summed_modes = np.abs(all_modes[highest_two]).sum(axis=1)
+
+    closest_indices = match_frequencies(frequencies, central_freqs)
+    input_modes = np.zeros((len(central_freqs), len(all_modes)))
+    input_modes[np.arange(len(central_freqs)), closest_indices] = summed_modes
+    traces = idct_reconstruction(input_modes, null_hypothesis, nCounts, renormalize)
+    amplitudes = traces.max(axis=1) - null_hypothesis
+    return frequencies[closest_indices], amplitudes, traces
         
     
 if __name__=='__main__':
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how long the analysis modules take to import, and checks that importing them doesn't
+pull in the slow optional packages (qutip, pyGSTi, matplotlib), which are only imported inside
+the functions that use them.
+
+    python import_times.py
+
+prints the import time of each module (after numpy is loaded, in a fresh interpreter) and exits
+with an error if any module is over its budget or loads one of the slow packages.
+"""
+
+import os
+import sys
+import subprocess
+
+#seconds each module may take to import once numpy is loaded; Drift also loads scipy.fftpack
+IMPORT_BUDGETS = {'helpers': 0.05, 'NoiseSignal2': 0.05, 'data_list_creator': 0.05, 'Drift': 0.5}
+SLOW_PACKAGES = ('qutip', 'pygsti', 'matplotlib', 'pylab')
+
+_TIMING_CODE = '''
+import sys, time
+import numpy
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+slow = [name for name in sys.modules if name.split('.')[0] in {slow!r}]
+print(elapsed)
+print(' '.join(sorted(set(name.split('.')[0] for name in slow))))
+'''
+
+def import_time(module, repeats=5):
+    '''
+    Returns (seconds, slow packages loaded) for importing module in a fresh interpreter, after numpy.
+    The time is the best of repeats runs, so a busy machine doesn't make it look slower than it is.
+    '''
+    code = _TIMING_CODE.format(module=module, slow=SLOW_PACKAGES)
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    slow = []
+    for i in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], cwd=repo_dir, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout.splitlines()
+        seconds = float(output[0])
+        slow = output[1].split() if len(output) > 1 else []
+        best = seconds if best is None else min(best, seconds)
+    return best, slow
+
+def check_import_times(budgets=IMPORT_BUDGETS, repeats=5):
+    '''Prints the import time of each module against its budget; returns True if they are all within budget'''
+    within_budget = True
+    for module, budget in budgets.items():
+        seconds, slow = import_time(module, repeats)
+        ok = seconds <= budget and not slow
+        within_budget = within_budget and ok
+        print("{:<20} {:7.1f} ms (budget {:.0f} ms){}{}".format(module, seconds*1000, budget*1000,
+              ", loads " + ", ".join(slow) if slow else "", "" if ok else "  <-- OVER"))
+    return within_budget
+
+if __name__=='__main__':
+    if not check_import_times():
+        sys.exit(1)
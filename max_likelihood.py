@@ -8,6 +8,7 @@ Created on Wed Sep 19 11:25:52 2018
 import numpy as np
 import pylab as plt
 from scipy import signal
+from dataset import as_times_and_values
 
 def p1(t, nominal):
     #probability of being in the 1-state at time t
@@ -43,6 +44,7 @@ def p0_saw(times, nominal):
     return 0.5 - nominal[1]*signal.sawtooth(2*np.pi*nominal[0]*times + nominal[2], tpp)
 
 def loss(time_data, y_data, nominal, form='sine', tpp=None):
+    time_data, y_data = as_times_and_values(time_data, y_data)
     if form == 'sine':
         p1 = p1_sine(time_data, nominal)
         p0 = p0_sine(time_data, nominal)
@@ -112,6 +114,7 @@ def derivative_analysis(time_data, y_data, nominal, f_range, a_range, p_range, f
     plt.show()
     
 def scipy_optimization(times, vals, guess_params, form, actual_params=None, plot=False, method='Nelder-Mead'):
+    times, vals = as_times_and_values(times, vals)
     from scipy.optimize import minimize
     def neg_ll(param_list):
         f = param_list[0]
@@ -167,6 +170,7 @@ def bit_flip(input_bit, flip_probability):
     return out_bit[0]
 
 def variable_loss(time_data, y_data, variable_name, variable_array, nominal_variables, form='sine', tpp = None):
+    time_data, y_data = as_times_and_values(time_data, y_data)
     losses=[]
     for variable in variable_array:
         f = nominal_variables[0]
@@ -195,6 +199,7 @@ def variable_loss(time_data, y_data, variable_name, variable_array, nominal_vari
     return variable_array, losses, minimum_index
 
 def MLE(times, vals, nominal_params, f_range, a_range, p_range, form, tpp=None, input_f=None, input_a=None, input_p=None, plot_range=None):
+    times, vals = as_times_and_values(times, vals)
     if input_f == None:
         variable_array = f_range
         variable = 'frequency'
@@ -264,6 +269,7 @@ def MLE(times, vals, nominal_params, f_range, a_range, p_range, form, tpp=None,
     return times, reconst, input_f, input_a, input_p
 
 def two_dimensional_optimization(times, vals, f, a_range, p_range, form, verbose=True):
+    times, vals = as_times_and_values(times, vals)
     num_a = len(a_range)
     num_p = len(p_range)
     losses = np.ndarray(shape=(num_a, num_p))
@@ -292,6 +298,7 @@ def two_dimensional_optimization(times, vals, f, a_range, p_range, form, verbose
                 
 
 def three_dimensional_optimization(times, vals, f_range, a_range, p_range, form, verbose=False):
+    times, vals = as_times_and_values(times, vals)
     num_f = len(f_range)
     num_a = len(a_range)
     num_p = len(p_range)
@@ -340,6 +347,7 @@ def tensorflow_optimization(times, vals, init_f, init_a, init_p, tpp=None, nepoc
   This version uses minibatching, to allow randomness to encourage jumps out of
   shallow local minima.
   '''
+  times, vals = as_times_and_values(times, vals)
   print("Model training for %s epochs, with evaluation every %s steps" % (nepochs,neval_period))
   
   data = {'samples': vals, 'time': times}
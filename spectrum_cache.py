@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+In-process LRU cache (with an optional on-disk .npz tier) for the spectra computed by Drift.
+
+Results are keyed by a fingerprint of the data itself, so re-running a transform on the same
+data is a dictionary lookup, and changing the data (or the null hypothesis, spectrum mode or
+frequency window) automatically gives a new key.
+"""
+
+import os
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+
+def data_fingerprint(*items):
+    '''
+    Returns a hex digest of any mix of arrays, numbers, strings and None.
+    Arrays are hashed by their dtype, shape and raw bytes, so any change to the data changes the digest.
+    '''
+    digest = hashlib.sha1()
+    for item in items:
+        if item is None or isinstance(item, (str, int, float, tuple)):
+            digest.update(repr(item).encode())
+        else:
+            array = np.ascontiguousarray(item)
+            digest.update("{}{}".format(array.dtype.str, array.shape).encode())
+            digest.update(array.reshape(-1).view(np.uint8))
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def _entry_nbytes(results):
+    return sum(value.nbytes for value in results.values())
+
+
+class SpectrumCache(object):
+    '''
+    Maps keys to dicts of arrays. Keeps the maxsize most recently used entries in memory, as long as
+    their arrays take up no more than max_bytes in total (None for no limit); an entry bigger than
+    max_bytes is never kept in memory. If cache_dir is set, entries are also written there as
+    <key>.npz and read back when they aren't in memory.
+    '''
+    def __init__(self, maxsize=32, cache_dir=None, max_bytes=256*1024**2):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return "SpectrumCache(entries={}, maxsize={}, nbytes={}, max_bytes={}, cache_dir={}, hits={}, misses={})".format(len(self.entries), self.maxsize, self.nbytes, self.max_bytes, self.cache_dir, self.hits, self.misses)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, *items):
+        return data_fingerprint(*items)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def get(self, key):
+        '''Returns the cached dict of arrays for key, or None if it isn't cached'''
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.cache_dir is not None and os.path.exists(self._disk_path(key)):
+            with np.load(self._disk_path(key)) as stored:
+                results = {name: stored[name] for name in stored.files}
+            self._remember(key, results)
+            self.hits += 1
+            return results
+        self.misses += 1
+        return None
+
+    def put(self, key, results):
+        '''Caches a dict of arrays under key, in memory and (if cache_dir is set) on disk'''
+        results = {name: np.asarray(value) for name, value in results.items()}
+        self._remember(key, results)
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            #write to a temporary file first so an interrupted write never leaves a truncated entry
+            temp_path = self._disk_path(key) + ".tmp.npz"
+            np.savez(temp_path, **results)
+            os.replace(temp_path, self._disk_path(key))
+
+    def _remember(self, key, results):
+        if key in self.entries:
+            self.nbytes -= _entry_nbytes(self.entries.pop(key))
+        size = _entry_nbytes(results)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self.entries[key] = results
+        self.nbytes += size
+        while len(self.entries) > self.maxsize or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+            self.nbytes -= _entry_nbytes(self.entries.popitem(last=False)[1])
+
+    def clear(self, disk=False):
+        '''Empties the in-memory cache, and the on-disk one too if disk=True'''
+        self.entries.clear()
+        self.nbytes = 0
+        if disk and self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            for file_name in os.listdir(self.cache_dir):
+                if file_name.endswith(".npz"):
+                    os.remove(os.path.join(self.cache_dir, file_name))
+
+
+#shared by all Drift objects; set spectrum_cache.cache_dir to keep spectra between sessions,
+#or spectrum_cache.max_bytes to change how much memory it may hold on to
+spectrum_cache = SpectrumCache()